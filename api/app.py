@@ -1,9 +1,16 @@
-from flask import Flask, request, jsonify, Response
-from api.model import Result
+from flask import Flask, request, jsonify, Response, g
+import json
+import os
+import uuid
+from typing import Optional, Dict, Iterator, List
+from api.model import Result, TextLabels
 from loguru import logger
-from api.services import InfoExtractionService, InvalidContentIdentifyService
-from concurrent.futures import ThreadPoolExecutor
-from api.app_const import ServiceType, STR_ONE, users, APP_SECRET_KEY
+from api.services import InfoExtractionService, InvalidContentIdentifyService, ModelRegistry, CallbackDispatcher
+from api.services.ServiceBase import ServiceBase
+from api.utility import JsonUtils, Metrics, RawJson, TaskStore, BoundedExecutor, REJECT_QUEUE_FULL, STATE_SUCCEEDED
+from api.app_const import ServiceType, STR_ONE, users, APP_SECRET_KEY, PRELOAD_MODELS, TASK_MAX_ATTEMPTS, \
+    EXECUTOR_WORKERS, EXECUTOR_QUEUE_SIZE, EXECUTOR_CLIENT_MAX_TASKS, EXECUTOR_RETRY_AFTER, EXECUTOR_RETRY_AFTER_MAX, \
+    INCREMENTAL_CHECK_ENABLED, BATCH_MAX_TASKS
 from functools import wraps
 import jwt
 import datetime
@@ -14,7 +21,25 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = APP_SECRET_KEY
 app.config['JSON_AS_ASCII'] = False  # 禁用 ASCII 转义
 
-executor = ThreadPoolExecutor(max_workers=20)  # 创建一个线程池，设置最大线程数
+# 创建一个有界的线程池：排队已满或客户端未完成任务数达到上限时立即拒绝
+executor = BoundedExecutor(max_workers=EXECUTOR_WORKERS, max_queue=EXECUTOR_QUEUE_SIZE,
+                           client_limits={client_id: user["max_tasks"] for client_id, user in users.items()
+                                          if "max_tasks" in user},
+                           default_client_limit=EXECUTOR_CLIENT_MAX_TASKS,
+                           default_retry_after=EXECUTOR_RETRY_AFTER, max_retry_after=EXECUTOR_RETRY_AFTER_MAX)
+Metrics.register_gauge("executor", executor.stats)
+
+# 批量提交按任务数占用名额，每批的任务数超过线程池容量时满批的请求总是被拒绝，因此不超过线程池容量
+batch_max_tasks = min(BATCH_MAX_TASKS, executor.capacity)
+if batch_max_tasks < BATCH_MAX_TASKS:
+    logger.warning(f"BATCH_MAX_TASKS（{BATCH_MAX_TASKS}）超过线程池容量 EXECUTOR_WORKERS + EXECUTOR_QUEUE_SIZE"
+                   f"（{executor.capacity}），每批最多的任务数按{batch_max_tasks}处理")
+
+# 预加载模型（使用gunicorn的preload_app时在master进程中加载，worker进程共享），否则在后台加载
+if PRELOAD_MODELS:
+    ModelRegistry.preload()
+else:
+    ModelRegistry.start_background_preload()
 
 # 初始化 Limiter
 limiter = Limiter(
@@ -24,6 +49,257 @@ limiter = Limiter(
 )
 
 
+_background_services_pid = None
+
+
+def start_background_services() -> None:
+    """
+    在当前进程中启动回调发送器与任务记录的心跳线程（gunicorn fork之后在各worker中启动；重复调用时只启动一次）
+    :return:
+    """
+    global _background_services_pid
+    if _background_services_pid == os.getpid():
+        return
+    _background_services_pid = os.getpid()
+    CallbackDispatcher.get_instance()
+    task_store = TaskStore.get_instance()
+    task_store.start(resume_task)
+    Metrics.register_gauge("tasks", task_store.count_by_state)
+
+
+@app.before_request
+def ensure_background_services() -> None:
+    start_background_services()
+
+
+def submit_task(service_type: ServiceType, task_id: str, task_request: dict) -> Optional[Response]:
+    """
+    记录任务并交给线程池执行
+    :param service_type: 服务类型
+    :param task_id: 任务ID
+    :param task_request: 执行任务所需的参数
+    :return: 线程池已满或客户端未完成任务数达到上限时返回拒绝的响应（503/429，带Retry-After），
+             相同task_id的任务尚未完成时返回409，否则返回None
+    """
+    client_id = g.client_id
+    reject_reason = executor.reserve(client_id)
+    if reject_reason is not None:
+        return reject_response(reject_reason, client_id, task_id)
+
+    try:
+        is_created = TaskStore.get_instance().create(client_id, task_id, service_type.value, task_request)
+    except Exception:
+        executor.release(client_id)
+        raise
+    if not is_created:
+        executor.release(client_id)
+        return conflict_response([task_id])
+    executor.submit(client_id, execute_task, client_id, task_id, service_type.value, task_request)
+    return None
+
+
+def submit_batch(batch_id: str, items: List[dict], version: int, notify_url: Optional[str],
+                 combined_callback: bool) -> Optional[Response]:
+    """
+    记录批量任务中的各任务，整批作为一个任务交给线程池执行（按任务数占用名额）
+    :param batch_id: 批次ID
+    :param items: 任务列表，[{"task_id", "url", "options", "notify_url"}, ...]
+    :param version:
+    :param notify_url: 合并回调的地址
+    :param combined_callback: 是否合并回调
+    :return: 线程池已满或客户端未完成任务数达到上限时返回拒绝的响应，任一task_id的任务尚未完成时返回409，否则返回None
+    """
+    client_id = g.client_id
+    reject_reason = executor.reserve(client_id, count=len(items))
+    if reject_reason is not None:
+        return reject_response(reject_reason, client_id, batch_id)
+
+    try:
+        # 每个任务单独记录，可通过/task/<task_id>查询；进程退出后由其他进程按单个任务重新执行
+        unfinished = TaskStore.get_instance().create_many(
+            client_id, ServiceType.INVALID_CONTENT_IDENTIFY.value,
+            {item["task_id"]: {"url": item["url"], "notify_url": item["notify_url"], "options": item["options"],
+                               "version": version, "batch_id": batch_id} for item in items})
+    except Exception:
+        executor.release(client_id, count=len(items))
+        raise
+    if unfinished:
+        executor.release(client_id, count=len(items))
+        return conflict_response(unfinished)
+    executor.submit(client_id, execute_batch, client_id, batch_id, items, version, notify_url, combined_callback,
+                    count=len(items))
+    return None
+
+
+def reject_response(reject_reason: str, client_id: str, task_id: str) -> Response:
+    """
+    拒绝请求的响应（503/429，带Retry-After）
+    :param reject_reason: 拒绝原因
+    :param client_id:
+    :param task_id: 任务ID（批量提交时为批次ID）
+    :return:
+    """
+    retry_after = executor.retry_after()
+    if reject_reason == REJECT_QUEUE_FULL:
+        logger.warning(f"任务队列已满，拒绝请求，task_id：{task_id}，排队情况：{executor.stats()}")
+        response = jsonify(Result(-1, "服务繁忙，请稍后重试").to_dict())
+        response.status_code = 503
+    else:
+        logger.warning(f"客户端未完成的任务数已达上限，拒绝请求，client_id：{client_id}，task_id：{task_id}")
+        response = jsonify(Result(-1, "未完成的任务数已达上限，请稍后重试").to_dict())
+        response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def conflict_response(task_ids: List[str]) -> Response:
+    """
+    相同task_id的任务尚未完成时拒绝重复提交的响应（409）
+    :param task_ids: 尚未完成的任务ID
+    :return:
+    """
+    logger.warning(f"任务尚未完成，拒绝重复提交，task_id：{task_ids}")
+    response = jsonify(Result(-1, f"任务尚未完成，请勿重复提交：{', '.join(task_ids)}").to_dict())
+    response.status_code = 409
+    return response
+
+
+def execute_task(client_id: str, task_id: str, service_id: int, task_request: dict) -> None:
+    """
+    执行任务并记录状态与结果
+    :param client_id:
+    :param task_id:
+    :param service_id:
+    :param task_request:
+    :return:
+    """
+    task_store = TaskStore.get_instance()
+    task_store.mark_running(client_id, task_id)
+    try:
+        labels = None
+        if service_id == ServiceType.INVALID_CONTENT_IDENTIFY.value:
+            # 记录本次的段落预测结果，供之后修改的标书进行增量检查
+            labels = {} if INCREMENTAL_CHECK_ENABLED else None
+            previous_task_id = task_request.get("previous_task_id")
+            previous_labels = load_previous_labels(client_id, previous_task_id) if previous_task_id else None
+            result, message = InvalidContentIdentifyService().process(task_request["url"], task_request["notify_url"],
+                                                                      task_id, task_request["options"],
+                                                                      task_request["version"],
+                                                                      previous_labels=previous_labels, labels=labels)
+        else:
+            result, message = InfoExtractionService().process(task_request["options"], task_request["url"],
+                                                              task_request["notify_url"], task_id)
+        task_store.mark_finished(client_id, task_id, message is None, message,
+                                 JsonUtils.dumps(result) if result is not None else None,
+                                 TextLabels.dump_many(labels) if labels else None)
+    except Exception as e:
+        logger.exception(e)
+        task_store.mark_finished(client_id, task_id, False, "处理请求的内容失败")
+        ServiceBase().notify_fail_by_self_error(task_request["url"], task_request["notify_url"], task_id)
+
+
+def execute_batch(client_id: str, batch_id: str, items: List[dict], version: int, notify_url: Optional[str],
+                  combined_callback: bool) -> None:
+    """
+    执行批量任务并记录各任务的状态与结果
+    :param client_id:
+    :param batch_id:
+    :param items:
+    :param version:
+    :param notify_url:
+    :param combined_callback:
+    :return:
+    """
+    task_store = TaskStore.get_instance()
+    for item in items:
+        task_store.mark_running(client_id, item["task_id"])
+    try:
+        # 记录各任务的段落预测结果，之后修改的标书可以通过previous_task_id引用批量任务中的任务进行增量检查
+        labels = {} if INCREMENTAL_CHECK_ENABLED else None
+        results = InvalidContentIdentifyService().process_batch(items, version, batch_id, notify_url=notify_url,
+                                                                combined_callback=combined_callback, labels=labels)
+        for index, (item, (result, message)) in enumerate(zip(items, results)):
+            item_labels = labels.get(index) if labels is not None else None
+            task_store.mark_finished(client_id, item["task_id"], message is None, message,
+                                     JsonUtils.dumps(result) if result is not None else None,
+                                     TextLabels.dump_many(item_labels) if item_labels else None)
+    except Exception as e:
+        logger.exception(e)
+        for item in items:
+            task_store.mark_finished(client_id, item["task_id"], False, "处理请求的内容失败")
+        if combined_callback:
+            ServiceBase().notify_batch(notify_url, batch_id,
+                                       [{"task_id": item["task_id"], "result": "", "success": False,
+                                         "message": "处理请求的内容失败"} for item in items])
+        else:
+            for item in items:
+                ServiceBase().notify_fail_by_self_error(item["url"], item["notify_url"], item["task_id"])
+
+
+def load_previous_labels(client_id: str, previous_task_id: str) -> Optional[Dict[str, TextLabels]]:
+    """
+    读取之前任务记录的段落预测结果（用于增量检查）
+    :param client_id:
+    :param previous_task_id: 之前的任务ID（只能引用当前客户端已成功完成的任务）
+    :return: {检查项: 预测结果}，任务不存在、未成功或结果已过期时返回None（进行完整检查）
+    """
+    task_store = TaskStore.get_instance()
+    task = task_store.get(client_id, previous_task_id)
+    data = task_store.read_labels(task) if task is not None and task["state"] == STATE_SUCCEEDED else None
+    if data is None:
+        logger.warning(f"没有之前任务的检查结果，进行完整检查，previous_task_id：{previous_task_id}")
+        return None
+    try:
+        return TextLabels.load_many(data)
+    except (ValueError, KeyError, OSError) as e:
+        logger.error(f"读取之前任务的检查结果失败，进行完整检查，previous_task_id：{previous_task_id}，详细信息：{str(e)}")
+        return None
+
+
+def resume_task(task: dict) -> None:
+    """
+    重新执行其他进程（已退出）未完成的任务
+    :param task: 任务记录
+    :return:
+    """
+    task_request = json.loads(task["request"])
+    if task["attempts"] >= TASK_MAX_ATTEMPTS:
+        logger.error(f"任务已执行{task['attempts']}次仍未完成，不再执行，task_id: {task['task_id']}")
+        TaskStore.get_instance().mark_finished(task["client_id"], task["task_id"], False, "处理请求的内容失败")
+        ServiceBase().notify_fail_by_self_error(task_request["url"], task_request["notify_url"], task["task_id"])
+        return
+    # 已接受的任务，不受排队与客户端上限的限制
+    executor.reserve(task["client_id"], force=True)
+    executor.submit(task["client_id"], execute_task, task["client_id"], task["task_id"], task["service_id"],
+                    task_request)
+
+
+def json_response(data, status: int = 200) -> Response:
+    """
+    JSON响应（由JsonUtils直接编码为字节，检查结果片段不再重新编码）
+    :param data:
+    :param status:
+    :return:
+    """
+    return Response(JsonUtils.dumps(data), status=status, mimetype="application/json")
+
+
+def stream_check_records(records: Iterator[bytes], task_id: str) -> Iterator[bytes]:
+    """
+    流式输出检查结果，最后一行为检查结果的状态（Result，检查出现异常时为失败，客户端据此判断输出是否完整）
+    :param records: 检查结果（每行一个文档一个检查项）
+    :param task_id:
+    :return:
+    """
+    try:
+        yield from records
+        yield JsonUtils.encode(Result.success_default("检查完成").to_dict()) + b"\n"
+    except Exception as e:
+        logger.error(f"流式检查出现异常，task_id：{task_id}")
+        logger.exception(e)
+        yield JsonUtils.encode(Result.fail_default("检查失败").to_dict()) + b"\n"
+
+
 def generate_token(client_id):
     """
     生成Toekn
@@ -53,6 +329,7 @@ def requires_auth(f):
         try:
             token = token.split()[1]  # Remove "Bearer" prefix
             data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            g.client_id = data.get('sub')
         except jwt.ExpiredSignatureError:
             return jsonify({"message": "Token has expired"}), 401
         except jwt.InvalidTokenError:
@@ -90,6 +367,55 @@ def health() -> Response:
     return jsonify("OK")
 
 
+@app.route('/ready', methods=['GET'])
+def ready() -> Response:
+    """
+    就绪探测接口（必需的检查项的模型已加载并预热完成），返回各检查项是否就绪；有未就绪的检查项时在后台重新加载其模型
+    :return:
+    """
+    ModelRegistry.retry_failed_in_background()
+    result = {"status": "OK" if ModelRegistry.is_ready() else "NOT READY", "checks": ModelRegistry.check_status()}
+    if ModelRegistry.is_ready():
+        return jsonify(result)
+    return jsonify(result), 503
+
+
+@app.route('/metrics', methods=['GET'])
+@requires_auth
+def metrics() -> Response:
+    """
+    运行指标接口（下载、回调耗时等，为当前worker进程的统计）；包含任务数、队列深度与线程池容量，需要认证
+    :return:
+    """
+    return jsonify(Metrics.snapshot())
+
+
+@app.route('/task/<task_id>', methods=['GET'])
+@requires_auth
+def task_status(task_id: str) -> Response:
+    """
+    查询异步任务的状态与结果（只能查询当前客户端提交的任务）
+    :param task_id: 任务ID
+    :return:
+    """
+    task_store = TaskStore.get_instance()
+    task = task_store.get(g.client_id, task_id)
+    if task is None:
+        return jsonify(Result(-1, "任务不存在").to_dict()), 404
+    result = task_store.read_result(task)
+    data = {
+        "task_id": task_id,
+        "state": task["state"],
+        "message": task["message"],
+        "attempts": task["attempts"],
+        "created_at": task["created_at"],
+        "started_at": task["started_at"],
+        "finished_at": task["finished_at"],
+        "result": RawJson(result) if result is not None else None
+    }
+    return json_response(Result.success_with_data("查询成功", data=data).to_dict())
+
+
 @app.route('/service', methods=['POST'])
 @requires_auth
 def service() -> Response:
@@ -121,8 +447,9 @@ def service() -> Response:
         # 判断是否同步方式
         is_sync_str: str = request.args.get('is_sync')
         is_sync = True if is_sync_str is not None and is_sync_str == STR_ONE else False
-        if not is_sync and not notify_url:
-            return jsonify(Result(-1, "缺少notify_url").to_dict())
+        # 同步方式时是否流式输出（NDJSON，每个文档每个检查项一行，检查完即输出）
+        is_stream_str: str = request.args.get('stream')
+        is_stream = True if is_stream_str is not None and is_stream_str == STR_ONE else False
 
         # 增加版本(v1版维持原来的数据结果（入参与出参），v2版在原来的基础上少一层，少group_id）
         version = request.args.get('v')
@@ -130,11 +457,62 @@ def service() -> Response:
             version = 1
         else:
             version = int(version)
-        return handle_service_invalid_content_identify(url, notify_url, task_id, is_sync=is_sync, version=version)
+        return handle_service_invalid_content_identify(url, notify_url, task_id, is_sync=is_sync, version=version,
+                                                       is_stream=is_stream)
     else:
         return jsonify(Result(101, "ServiceId不正确").to_dict())
 
 
+@app.route('/service/batch', methods=['POST'])
+@requires_auth
+def service_batch() -> Response:
+    """
+    批量提交无效内容识别任务（异步）：整批同时下载、合并检查；
+    各任务的结果按各自的notify_url回调（callback_mode为task，默认），或整批合并为一次回调（callback_mode为batch）
+    :return: 响应结果
+    """
+    # 检查服务ID（只有无效内容识别支持批量提交）
+    service_id: str = request.args.get('id')
+    if service_id is None or service_id == "":
+        return jsonify(Result(100, "缺少ServiceId").to_dict())
+    if ServiceType.get_service_by_value(int(service_id)) != ServiceType.INVALID_CONTENT_IDENTIFY:
+        return jsonify(Result(101, "ServiceId不正确").to_dict())
+    if request.content_type != "application/json":
+        return jsonify(Result(100, "缺少请求内容").to_dict())
+
+    tasks = request.json.get("tasks")
+    if not isinstance(tasks, list) or len(tasks) == 0:
+        return jsonify(Result(-1, "缺少tasks").to_dict())
+    if len(tasks) > batch_max_tasks:
+        return jsonify(Result(-1, f"每批最多{batch_max_tasks}个任务").to_dict())
+    callback_mode = request.json.get("callback_mode") or "task"
+    if callback_mode not in ("task", "batch"):
+        return jsonify(Result(-1, "callback_mode不正确").to_dict())
+    combined_callback = callback_mode == "batch"
+    notify_url = request.json.get("notify_url")
+    batch_id = request.json.get("batch_id") or uuid.uuid4().hex
+
+    items = []
+    for index, task in enumerate(tasks):
+        if not isinstance(task, dict) or not task.get("task_id") or not task.get("url") or not task.get("options"):
+            return jsonify(Result(-1, f"第{index + 1}个任务缺少task_id、url或options").to_dict())
+        if not isinstance(task["options"], list) or not all(isinstance(option, str) for option in task["options"]):
+            return jsonify(Result(-1, f"第{index + 1}个任务的options不正确").to_dict())
+        items.append({"task_id": task["task_id"], "url": task["url"], "options": task["options"],
+                      # 合并回调时不再按任务分别回调
+                      "notify_url": None if combined_callback else task.get("notify_url") or notify_url})
+    if len({item["task_id"] for item in items}) != len(items):
+        return jsonify(Result(-1, "task_id重复").to_dict())
+
+    version = request.args.get('v')
+    version = 2 if version == str(2) else 1
+
+    rejected = submit_batch(batch_id, items, version, notify_url, combined_callback)
+    if rejected is not None:
+        return rejected
+    return jsonify(Result.success_with_data("请求成功", data={"batch_id": batch_id}).to_dict())
+
+
 @app.errorhandler(Exception)
 def handle_global_exception(e) -> Response:
     """
@@ -170,21 +548,24 @@ def handle_service_info_extracted(url: str, notify_url: str, task_id: str) -> Re
         return jsonify(check_result.to_dict())
 
     # 通过线程进行提取
-    info_extract_service = InfoExtractionService()
-    executor.submit(info_extract_service.process, schema, url, notify_url, task_id)
+    rejected = submit_task(ServiceType.INFO_EXTRACTED, task_id, {"options": schema, "url": url, "notify_url": notify_url})
+    if rejected is not None:
+        return rejected
     return jsonify(Result.success_default("请求成功").to_dict())
 
 
 def handle_service_invalid_content_identify(url: str, notify_url: str,
                                             task_id: str,
                                             is_sync: bool = False,
-                                            version: int = 1) -> Response:
+                                            version: int = 1,
+                                            is_stream: bool = False) -> Response:
     """
     无效内容识别服务
     :param url: 文件URL
     :param notify_url: 通知URL
     :param task_id: 任务id
     :param is_sync: 是否为同步方式
+    :param is_stream: 同步方式时是否流式输出
     :return:
     """
     check_result = None
@@ -193,27 +574,46 @@ def handle_service_invalid_content_identify(url: str, notify_url: str,
     if not check_option:
         check_result = Result(-1, "缺少要识别的信息")
 
+    # 增量检查：引用之前对同一标书（修改前）的检查任务，只检查内容有变化的段落
+    previous_task_id = request.json.get("previous_task_id")
+    if previous_task_id and previous_task_id == task_id:
+        check_result = Result(-1, "previous_task_id不能与task_id相同")
+
     if check_result is not None:
         # 检查没通过
         return jsonify(check_result.to_dict())
 
     invalid_content_identify = InvalidContentIdentifyService()
 
-    if is_sync:
+    if is_sync and is_stream:
+        # 同步方式（流式输出）
+        previous_labels = load_previous_labels(g.client_id, previous_task_id) if previous_task_id else None
+        records, check_message = invalid_content_identify.process_stream(url, notify_url, task_id, check_option,
+                                                                         version, previous_labels=previous_labels)
+        if records is None:
+            # 下载或解析失败（尚未开始输出）
+            msg = check_message if check_message is not None and len(check_message) > 0 else "检查失败"
+            return jsonify(Result.fail_default(msg).to_dict())
+        return Response(stream_check_records(records, task_id), mimetype="application/x-ndjson")
+    elif is_sync:
         # 同步方式
+        previous_labels = load_previous_labels(g.client_id, previous_task_id) if previous_task_id else None
         check_result, check_message = invalid_content_identify.process_sync(url, notify_url, task_id, check_option,
-                                                                            version)
+                                                                            version, previous_labels=previous_labels)
         if check_result is None:
             # 失败
             msg = check_message if check_message is not None and len(check_message) > 0 else "检查失败"
             return jsonify(Result.fail_default(msg).to_dict())
         else:
             # 检查成功
-            return jsonify(Result.success_with_data("检查完成", data=check_result).to_dict())
+            return json_response(Result.success_with_data("检查完成", data=check_result).to_dict())
     else:
-        # 异步方式
-        # invalid_content_identify.process(url, notify_url, task_id, check_option)
-        executor.submit(invalid_content_identify.process, url, notify_url, task_id, check_option, version)
+        # 异步方式（未指定notify_url时，客户端通过/task/<task_id>查询结果）
+        rejected = submit_task(ServiceType.INVALID_CONTENT_IDENTIFY, task_id,
+                               {"url": url, "notify_url": notify_url, "options": check_option, "version": version,
+                                "previous_task_id": previous_task_id})
+        if rejected is not None:
+            return rejected
         return jsonify(Result.success_default("请求成功").to_dict())
 
 
@@ -221,4 +621,5 @@ def handle_service_invalid_content_identify(url: str, notify_url: str,
 if __name__ == '__main__':
     # 设置日志文件每天切割，文件名中包含日期
     logger.add("logs/app_{time:YYYY-MM-DD}.log", rotation="1 day", format="{time} {level} {message}")
+    start_background_services()
     app.run(debug=True)
@@ -1,5 +1,6 @@
 from enum import Enum
 from typing import Optional
+import os
 
 SUCCESS_CODE = 10000
 
@@ -7,12 +8,121 @@ STR_ONE = "1"
 STR_ZERO = "0"
 
 
+# 客户端：credential为密钥，max_tasks为未完成的异步任务数上限（不设置时使用EXECUTOR_CLIENT_MAX_TASKS）
 users = {
-    "yqb": {"credential": "7Kj#mRpL9q@X"}
+    "yqb": {"credential": "7Kj#mRpL9q@X", "max_tasks": 100}
 }
 
 APP_SECRET_KEY = "'3a7e9be1f92e27d227de4548214d7c393bc2325b0b1f8e5e4b0c81574c7bc5d6'"
 
+# 分词缓存的最大占用内存（字节）
+TOKEN_CACHE_MAX_BYTES = int(os.getenv("TOKEN_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# jieba词典缓存文件（镜像构建时生成）
+JIEBA_CACHE_FILE = os.getenv("JIEBA_CACHE_FILE", "cache/jieba.cache")
+
+# 段落预测结果缓存：是否启用、SQLite文件路径、进程内缓存条数、磁盘缓存最大条数
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", STR_ONE) == STR_ONE
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "cache/prediction_cache.sqlite3")
+PREDICTION_CACHE_MEMORY_ENTRIES = int(os.getenv("PREDICTION_CACHE_MEMORY_ENTRIES", 200000))
+PREDICTION_CACHE_MAX_ROWS = int(os.getenv("PREDICTION_CACHE_MAX_ROWS", 5000000))
+
+# 技术标准级联预测的置信度阈值（默认0，不使用级联；需显式设置阈值且存在第一级模型文件时才启用，如0.99，
+# 可参考训练时输出的各阈值的级联报告选择）
+TECH_STANDARD_CASCADE_THRESHOLD = float(os.getenv("TECH_STANDARD_CASCADE_THRESHOLD", 0))
+
+# 技术标准规则预筛选：启用的规则（逗号分隔，按顺序匹配；默认为空，不使用预筛选，结果与模型完全一致）、判定为长段落的字数
+# 命中的规则直接决定结果，不再经过模型，启用前应先用PreFilterTesting在验证数据上评估各规则的精确率：
+#   long_narrative：长段落，且没有书名号、标准编号与关键词，判为0
+#   no_keyword：没有书名号与编号，且不包含任何关键词与标准代号，判为0
+#   title_with_code：《名称》+ 标准编号，或 标准编号 +《名称》，判为1
+#   standard_pattern：符合TextUtils中的技术标准格式，判为1
+# 如 TECH_STANDARD_PREFILTER_RULES=title_with_code,long_narrative
+TECH_STANDARD_PREFILTER_RULES = [name.strip() for name in os.getenv("TECH_STANDARD_PREFILTER_RULES", "").split(",")
+                                 if name.strip()]
+TECH_STANDARD_PREFILTER_LONG_TEXT = int(os.getenv("TECH_STANDARD_PREFILTER_LONG_TEXT", 100))
+
+# gunicorn的worker进程数（gunicorn.conf.py使用，与gunicorn的WEB_CONCURRENCY环境变量一致）
+GUNICORN_WORKERS = int(os.getenv("WEB_CONCURRENCY", 4))
+
+# 推理后端：thread（在请求线程中预测）或 process（进程池）；每个worker进程的进程池的进程数；每次交给进程池的段落数
+# 每个worker各自创建进程池，每个进程各加载一份模型，默认按worker数平分CPU核数，避免 worker数 × 核数 个进程争用CPU与内存
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "thread")
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", max((os.cpu_count() or 1) // max(GUNICORN_WORKERS, 1), 1)))
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", 2000))
+# 推理微批调度（默认不启用，适合大量段落数很少的并发请求）：并发请求的段落在时间窗口（毫秒）内汇集为一批，一次向量化与预测；
+# 每批最多的段落数（达到后立即预测，段落数不少于此值的请求不参与合并，在请求线程中直接预测）、
+# 每个检查类型执行预测的线程数（各检查类型可单独设置，见MICRO_BATCH_LANES）
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", STR_ZERO) == STR_ONE
+MICRO_BATCH_WINDOW_MS = float(os.getenv("MICRO_BATCH_WINDOW_MS", 10))
+MICRO_BATCH_MAX_TEXTS = int(os.getenv("MICRO_BATCH_MAX_TEXTS", 4000))
+MICRO_BATCH_WORKERS = int(os.getenv("MICRO_BATCH_WORKERS", 2))
+
+# 是否在加载应用时预加载模型（配合gunicorn的preload_app，在master进程fork之前加载）
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", STR_ONE) == STR_ONE
+# 就绪（/ready）所必需的检查项（逗号分隔，为空时任一检查项的模型就绪即可）；未就绪的检查项重新加载模型的间隔（秒）
+READY_REQUIRED_CHECKS = [name.strip() for name in os.getenv("READY_REQUIRED_CHECKS", "").split(",") if name.strip()]
+MODEL_RETRY_INTERVAL = float(os.getenv("MODEL_RETRY_INTERVAL", 60))
+
+# 流式下载标书文件时每次读取的字节数
+HTTP_CHUNK_SIZE = int(os.getenv("HTTP_CHUNK_SIZE", 64 * 1024))
+
+# HTTP连接池：缓存连接池的主机数、每个主机保持的连接数
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 20))
+# HTTP超时（秒）：建立连接、下载文件时每次读取、回调时等待响应
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_DOWNLOAD_TIMEOUT = float(os.getenv("HTTP_DOWNLOAD_TIMEOUT", 60))
+HTTP_CALLBACK_TIMEOUT = float(os.getenv("HTTP_CALLBACK_TIMEOUT", 30))
+# HTTP重试：最多重试次数、指数退避的基数（秒，依次等待0.5、1、2秒……）、需要重试的状态码
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+HTTP_RETRY_STATUS = [int(code) for code in os.getenv("HTTP_RETRY_STATUS", "429,502,503,504").split(",") if code.strip()]
+
+# 标书文件下载缓存：是否启用、目录、总大小上限（字节）、是否同时缓存解析结果
+DOWNLOAD_CACHE_ENABLED = os.getenv("DOWNLOAD_CACHE_ENABLED", STR_ONE) == STR_ONE
+DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "cache/downloads")
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+DOWNLOAD_CACHE_PARSED = os.getenv("DOWNLOAD_CACHE_PARSED", STR_ONE) == STR_ONE
+
+# 回调：是否异步发送、发送队列长度、发送线程数、每轮最多发送次数、重试退避的基数（秒）
+CALLBACK_ASYNC = os.getenv("CALLBACK_ASYNC", STR_ONE) == STR_ONE
+CALLBACK_QUEUE_SIZE = int(os.getenv("CALLBACK_QUEUE_SIZE", 1000))
+CALLBACK_WORKERS = int(os.getenv("CALLBACK_WORKERS", 4))
+CALLBACK_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", 5))
+CALLBACK_RETRY_BACKOFF = float(os.getenv("CALLBACK_RETRY_BACKOFF", 5))
+# 发送失败的回调：磁盘目录、重新发送的间隔（秒）、最长保留时间（秒）
+CALLBACK_SPOOL_DIR = os.getenv("CALLBACK_SPOOL_DIR", "cache/callbacks")
+CALLBACK_SPOOL_RETRY_INTERVAL = float(os.getenv("CALLBACK_SPOOL_RETRY_INTERVAL", 60))
+CALLBACK_SPOOL_MAX_AGE = float(os.getenv("CALLBACK_SPOOL_MAX_AGE", 3 * 24 * 3600))
+
+# 异步任务记录：SQLite文件路径、结果文件目录、已完成任务的保留时间（秒）
+TASK_STORE_PATH = os.getenv("TASK_STORE_PATH", "cache/tasks.sqlite3")
+TASK_RESULT_DIR = os.getenv("TASK_RESULT_DIR", "cache/results")
+TASK_RESULT_TTL = float(os.getenv("TASK_RESULT_TTL", 7 * 24 * 3600))
+# 进程心跳间隔、心跳超时时间（秒，超时后该进程未完成的任务由其他进程重新执行）、任务最多执行次数
+TASK_HEARTBEAT_INTERVAL = float(os.getenv("TASK_HEARTBEAT_INTERVAL", 10))
+TASK_OWNER_TIMEOUT = float(os.getenv("TASK_OWNER_TIMEOUT", 60))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", 3))
+# 无效内容检查的异步任务是否记录各段落文本的预测结果（之后修改的标书可通过previous_task_id引用该任务进行增量检查）
+INCREMENTAL_CHECK_ENABLED = os.getenv("INCREMENTAL_CHECK_ENABLED", STR_ONE) == STR_ONE
+
+# 同步检查的流式响应（NDJSON）：文档按段落数分批检查，每批检查完即输出，每批的段落数（文档不拆分）
+SYNC_STREAM_BATCH_PARAGRAPHS = int(os.getenv("SYNC_STREAM_BATCH_PARAGRAPHS", 5000))
+
+# 批量提交：每批最多的任务数、同时下载的文件数
+BATCH_MAX_TASKS = int(os.getenv("BATCH_MAX_TASKS", 100))
+BATCH_DOWNLOAD_WORKERS = int(os.getenv("BATCH_DOWNLOAD_WORKERS", 8))
+
+# 异步任务线程池（每个worker进程各一个）：线程数、排队任务的最大数量（超出时返回503）、
+# 每个客户端未完成任务数的默认上限（0表示不限制，超出时返回429）
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", 20))
+EXECUTOR_QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", 100))
+EXECUTOR_CLIENT_MAX_TASKS = int(os.getenv("EXECUTOR_CLIENT_MAX_TASKS", 0))
+# 拒绝请求时Retry-After的默认值与上限（秒，有任务耗时数据后按排队情况估算）
+EXECUTOR_RETRY_AFTER = int(os.getenv("EXECUTOR_RETRY_AFTER", 30))
+EXECUTOR_RETRY_AFTER_MAX = int(os.getenv("EXECUTOR_RETRY_AFTER_MAX", 300))
+
 
 class ServiceType(Enum):
     """
@@ -67,3 +177,13 @@ class InvalidContentType(Enum):
         """
         values = [item.value for item in InvalidContentType]
         return values
+
+
+# 推理微批调度各检查类型（lane）的设置，可通过如 MICRO_BATCH_WINDOW_MS_TECH_STANDARD 的环境变量单独设置：
+# 时间窗口越长、批次越大，吞吐越高，单个请求的延迟也越高
+MICRO_BATCH_LANES = {
+    item.value: {"window_ms": float(os.getenv(f"MICRO_BATCH_WINDOW_MS_{item.name}", MICRO_BATCH_WINDOW_MS)),
+                 "max_texts": int(os.getenv(f"MICRO_BATCH_MAX_TEXTS_{item.name}", MICRO_BATCH_MAX_TEXTS)),
+                 "workers": int(os.getenv(f"MICRO_BATCH_WORKERS_{item.name}", MICRO_BATCH_WORKERS))}
+    for item in InvalidContentType
+}
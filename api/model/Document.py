@@ -1,11 +1,15 @@
-from dataclasses import dataclass, field, asdict
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 import json
+import sys
 import uuid
+import numpy as np
 from loguru import logger
+from api.utility.JsonStreamReader import JsonStreamReader
+from api.utility.JsonUtils import JsonUtils
 
 
-@dataclass
+@dataclass(slots=True)
 class Paragraph:
     id: str
     page: str
@@ -20,18 +24,81 @@ class Paragraph:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class Document:
-    paragraphs: List[Paragraph]
+    """
+    文档：段落按列存储（id、页码、文本各一个列表，下标一一对应），不为每个段落单独创建对象；
+    需要逐个段落处理时可通过paragraphs得到Paragraph列表
+    """
+    ids: List[Any] = field(default_factory=list)
+    pages: List[Any] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+
+    @staticmethod
+    def from_paragraphs(paragraphs: Iterable[Paragraph]) -> 'Document':
+        """
+        从Paragraph列表构建文档
+        :param paragraphs:
+        :return:
+        """
+        document = Document()
+        for paragraph in paragraphs:
+            document.append(paragraph.id, paragraph.page, paragraph.text)
+        return document
+
+    @staticmethod
+    def from_json(doc_data) -> 'Document':
+        """
+        从文档的JSON对象构建文档
+        :param doc_data: {"paragraphs": [{"id": ..., "page": ..., "text": ...}, ...]}
+        :return:
+        """
+        document = Document()
+        for paragraph in doc_data.get("paragraphs", []):
+            document.append(paragraph.get("id", ""), paragraph.get("page", ""), paragraph.get("text", ""))
+        return document
+
+    def append(self, id: Any, page: Any, text: str) -> None:
+        """
+        追加一个段落（页码大量重复，字符串页码驻留为同一个对象）
+        :param id:
+        :param page:
+        :param text:
+        :return:
+        """
+        self.ids.append(id)
+        self.pages.append(sys.intern(page) if type(page) is str else page)
+        self.texts.append(text)
+
+    def take(self, indexes: Iterable[int]) -> 'Document':
+        """
+        按下标取出部分段落组成新文档（段落内容共用，不复制字符串）
+        :param indexes: 段落下标
+        :return:
+        """
+        document = Document()
+        for index in indexes:
+            document.ids.append(self.ids[index])
+            document.pages.append(self.pages[index])
+            document.texts.append(self.texts[index])
+        return document
+
+    @property
+    def paragraphs(self) -> List[Paragraph]:
+        return [Paragraph(id=id, page=page, text=text) for id, page, text in zip(self.ids, self.pages, self.texts)]
+
+    def __len__(self) -> int:
+        return len(self.texts)
 
     def to_dict(self) -> Dict[str, Any]:
         # 将 Document 对象转换为字典，包含段落列表
         return {
-            "paragraphs": [p.to_dict() for p in self.paragraphs]
+            "paragraphs": [{"id": id, "page": page, "text": text}
+                           for id, page, text in zip(self.ids, self.pages, self.texts)]
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentGroup:
     documents: Dict[str, Document]
 
@@ -40,7 +107,7 @@ class DocumentGroup:
         return {doc_id: doc.to_dict() for doc_id, doc in self.documents.items()}
 
 
-@dataclass
+@dataclass(slots=True)
 class DocRoot:
     document_groups: Dict[str, DocumentGroup]
 
@@ -62,6 +129,50 @@ class DocRoot:
             logger.error(e)
             return None
 
+    @staticmethod
+    def parse_json_stream(chunks: Iterable[bytes], include_group_id: bool = True) -> Optional['DocRoot']:
+        """
+        从JSON字节流边读取边解析为DocRoot对象（不生成完整的字符串与字典，段落直接构建为Paragraph）
+        :param chunks: JSON内容的字节块
+        :param include_group_id: 数据中是否包含GroupId这一层
+        :return: 解析失败时返回None（读取字节块时的网络异常不在此处理）
+        """
+        try:
+            reader = JsonStreamReader(chunks)
+            if include_group_id:
+                document_groups = {}
+                for group_id in reader.iter_object():
+                    document_groups[group_id] = DocumentGroup(documents=DocRoot._read_documents(reader))
+            else:
+                # 为了兼容原来的和新版的，这里模拟一层groupId
+                document_groups = {str(uuid.uuid4()): DocumentGroup(documents=DocRoot._read_documents(reader))}
+            reader.ensure_end()
+            return DocRoot(document_groups=document_groups)
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error(e)
+            return None
+
+    @staticmethod
+    def _read_documents(reader: JsonStreamReader) -> Dict[str, 'Document']:
+        """
+        从JSON流中读取一个方案组中的所有文档
+        :param reader:
+        :return:
+        """
+        documents = {}
+        for doc_id in reader.iter_object():
+            document = Document()
+            for key in reader.iter_object():
+                if key != "paragraphs":
+                    reader.skip_value()
+                    continue
+                document = Document()
+                for _ in reader.iter_array():
+                    paragraph = reader.read_value()
+                    document.append(paragraph.get("id", ""), paragraph.get("page", ""), paragraph.get("text", ""))
+            documents[doc_id] = document
+        return documents
+
     @staticmethod
     def build_object(json_data) -> Dict[str, Any]:
         """
@@ -74,15 +185,7 @@ class DocRoot:
         for group_id, group_data in json_data.items():
             documents = {}
             for doc_id, doc_data in group_data.items():
-                paragraphs = [
-                    Paragraph(
-                        id=paragraph.get("id", ""),
-                        page=paragraph.get("page", ""),
-                        text=paragraph.get("text", "")
-                    )
-                    for paragraph in doc_data.get("paragraphs", [])
-                ]
-                documents[doc_id] = Document(paragraphs=paragraphs)
+                documents[doc_id] = Document.from_json(doc_data)
             document_groups[group_id] = DocumentGroup(documents=documents)
         return document_groups
 
@@ -98,18 +201,30 @@ class DocRoot:
         document_groups = {}
         documents = {}
         for doc_id, doc_data in json_data.items():
-            paragraphs = [
-                Paragraph(
-                    id=paragraph.get("id", ""),
-                    page=paragraph.get("page", ""),
-                    text=paragraph.get("text", "")
-                )
-                for paragraph in doc_data.get("paragraphs", [])
-            ]
-            documents[doc_id] = Document(paragraphs=paragraphs)
+            documents[doc_id] = Document.from_json(doc_data)
         document_groups[str(uuid.uuid4())] = DocumentGroup(documents=documents)
         return document_groups
 
+    def split(self, max_paragraphs: int) -> Iterator['DocRoot']:
+        """
+        按段落数把文档分成若干部分（文档不拆分，每部分的段落数达到max_paragraphs后开始下一部分），
+        各部分共用原来的文档对象，方案组与文档的顺序与原数据一致
+        :param max_paragraphs:
+        :return:
+        """
+        document_groups: Dict[str, DocumentGroup] = {}
+        paragraph_count = 0
+        for group_id, group in self.document_groups.items():
+            for doc_id, document in group.documents.items():
+                document_groups.setdefault(group_id, DocumentGroup(documents={})).documents[doc_id] = document
+                paragraph_count += len(document)
+                if paragraph_count >= max_paragraphs:
+                    yield DocRoot(document_groups=document_groups)
+                    document_groups = {}
+                    paragraph_count = 0
+        if document_groups:
+            yield DocRoot(document_groups=document_groups)
+
     def to_json(self) -> str:
         # 将 DocRoot 对象转换为 JSON 字符串
         return json.dumps(
@@ -118,6 +233,37 @@ class DocRoot:
             indent=4
         )
 
+    def to_json_bytes(self, include_group_id: bool = True) -> bytes:
+        """
+        直接从列式存储的段落编码为JSON字节（结构与serialize相同），不生成整个结果的字典树，
+        每次只为一个文档生成段落字典
+        :param include_group_id: 是否包含GroupId这一层（不包含时只输出第一个方案组）
+        :return:
+        """
+        parts = [b"{"]
+        if include_group_id:
+            for group_index, (group_id, group) in enumerate(self.document_groups.items()):
+                if group_index > 0:
+                    parts.append(b",")
+                parts.append(JsonUtils.encode(group_id))
+                parts.append(b":{")
+                DocRoot._write_documents(group.documents, parts)
+                parts.append(b"}")
+        else:
+            first_group_id = next(iter(self.document_groups))
+            DocRoot._write_documents(self.document_groups[first_group_id].documents, parts)
+        parts.append(b"}")
+        return b"".join(parts)
+
+    @staticmethod
+    def _write_documents(documents: Dict[str, Document], parts: List[bytes]) -> None:
+        for doc_index, (doc_id, document) in enumerate(documents.items()):
+            if doc_index > 0:
+                parts.append(b",")
+            parts.append(JsonUtils.encode(doc_id))
+            parts.append(b":")
+            parts.append(JsonUtils.encode(document.to_dict()))
+
     @classmethod
     def serialize(cls, obj, include_group_id: bool = True) -> Dict[str, Any]:
         if isinstance(obj, cls):
@@ -128,3 +274,89 @@ class DocRoot:
                 return {doc_id: doc.to_dict() for doc_id, doc in
                         obj.document_groups[first_group_id].documents.items()}
         raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ParagraphBatch:
+    """
+    整个DocRoot的段落批次：将所有文档的段落文本收集为一个列表以便一次性预测，
+    并记录每个文档在列表中的偏移量，用于把预测结果回填到对应的文档
+    """
+
+    def __init__(self, doc_root: Optional[DocRoot] = None, strip: bool = False):
+        """
+        :param doc_root: 原始标书数据（为None时创建空批次）
+        :param strip: 是否去掉段落前后的空白字符（去掉后为空的段落不参与预测）
+        """
+        self.texts: List[str] = []  # 待预测的段落文本
+        self.indexes: np.ndarray = np.empty(0, dtype=np.intp)  # 与texts一一对应，段落在所属文档中的下标
+        self.group_keys: List[str] = []
+        self.doc_spans: List[Tuple[str, str, int, int]] = []  # (group_key, doc_key, 开始偏移, 结束偏移)
+        self.documents: List[Document] = []  # 与doc_spans一一对应的原始文档
+        if doc_root is None:
+            return
+
+        self.group_keys = list(doc_root.document_groups.keys())
+        indexes = []
+        for group_key, group_data in doc_root.document_groups.items():
+            for doc_key, doc_data in group_data.documents.items():
+                start = len(self.texts)
+                if strip:
+                    texts = [text.strip() for text in doc_data.texts]
+                    kept = [index for index, text in enumerate(texts) if text]
+                    self.texts.extend(texts[index] for index in kept)
+                    indexes.append(np.asarray(kept, dtype=np.intp))
+                else:
+                    self.texts.extend(doc_data.texts)
+                    indexes.append(np.arange(len(doc_data), dtype=np.intp))
+                self.doc_spans.append((group_key, doc_key, start, len(self.texts)))
+                self.documents.append(doc_data)
+        if indexes:
+            self.indexes = np.concatenate(indexes)
+
+    def stripped(self) -> 'ParagraphBatch':
+        """
+        从当前批次得到去掉前后空白字符、并过滤空段落的批次（不需要再遍历DocRoot，供多个检查项共用）
+        :return:
+        """
+        batch = ParagraphBatch()
+        batch.group_keys = self.group_keys
+        batch.documents = self.documents
+        kept = []
+        for group_key, doc_key, start, end in self.doc_spans:
+            new_start = len(batch.texts)
+            for index in range(start, end):
+                text = self.texts[index].strip()
+                if text:
+                    batch.texts.append(text)
+                    kept.append(index)
+            batch.doc_spans.append((group_key, doc_key, new_start, len(batch.texts)))
+        batch.indexes = self.indexes[np.asarray(kept, dtype=np.intp)]
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def unique_texts(self) -> Tuple[List[str], np.ndarray]:
+        """
+        段落去重（页眉、页脚、重复标题等只需要预测一次）
+        :return: 去重后的文本（保持首次出现的顺序），以及每个段落在去重文本中的索引
+        """
+        index_of: Dict[str, int] = {}
+        inverse = np.empty(len(self.texts), dtype=np.intp)
+        for index, text in enumerate(self.texts):
+            inverse[index] = index_of.setdefault(text, len(index_of))
+        return list(index_of), inverse
+
+    def build_result(self, labels) -> DocRoot:
+        """
+        根据预测结果构建结果对象（只保留标签为1的段落，方案组与文档的顺序与原数据一致）
+        :param labels: 与texts一一对应的预测结果
+        :return:
+        """
+        selected = np.asarray(labels) == 1
+        target_doc_root = DocRoot(document_groups={group_key: DocumentGroup(documents={})
+                                                   for group_key in self.group_keys})
+        for (group_key, doc_key, start, end), document in zip(self.doc_spans, self.documents):
+            target_doc_root.document_groups[group_key].documents[doc_key] = document.take(
+                self.indexes[start:end][selected[start:end]].tolist())
+        return target_doc_root
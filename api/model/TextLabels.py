@@ -0,0 +1,137 @@
+import hashlib
+import io
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+
+@dataclass(slots=True)
+class TextLabels:
+    """
+    一个检查项的段落预测结果，按段落文本的内容哈希记录（预测结果只取决于段落文本）；
+    用于增量检查：修改后的标书再次检查时，内容没有变化的段落直接使用上次的结果
+    """
+    model_hash: str  # 预测时的模型文件哈希（模型更新后上次的结果不再使用）
+    hashes: np.ndarray  # 文本哈希（uint64，升序、不重复）
+    labels: np.ndarray  # 与hashes一一对应的预测结果
+
+    @staticmethod
+    def hash_texts(texts: List[str]) -> np.ndarray:
+        """
+        段落文本的64位哈希
+        :param texts:
+        :return:
+        """
+        digests = b"".join(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest() for text in texts)
+        return np.frombuffer(digests, dtype=np.uint64).copy()
+
+    @staticmethod
+    def from_arrays(model_hash: str, hashes: np.ndarray, labels: np.ndarray) -> 'TextLabels':
+        """
+        由文本哈希与预测结果构建（排序并去重）
+        :param model_hash:
+        :param hashes:
+        :param labels:
+        :return:
+        """
+        unique_hashes, first = np.unique(hashes, return_index=True)
+        return TextLabels(model_hash=model_hash, hashes=unique_hashes,
+                          labels=np.asarray(labels, dtype=np.int8)[first])
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        查找文本哈希对应的预测结果
+        :param hashes:
+        :return: 与hashes一一对应的预测结果，没有记录的为-1
+        """
+        result = np.full(len(hashes), -1, dtype=np.int64)
+        if len(self.hashes) == 0 or len(hashes) == 0:
+            return result
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        found = self.hashes[positions] == hashes
+        result[found] = self.labels[positions[found]]
+        return result
+
+    def select(self, hashes: np.ndarray) -> 'TextLabels':
+        """
+        只保留指定文本哈希的预测结果（如从整批的预测结果中取出一份标书的部分）
+        :param hashes: 文本哈希（没有记录的忽略）
+        :return:
+        """
+        labels = self.lookup(hashes)
+        found = labels >= 0
+        return TextLabels.from_arrays(self.model_hash, hashes[found], labels[found])
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @staticmethod
+    def dump_many(labels: Dict[str, 'TextLabels']) -> bytes:
+        """
+        编码多个检查项的预测结果（npz格式）
+        :param labels: {检查项: 预测结果}
+        :return:
+        """
+        arrays = {}
+        for option, text_labels in labels.items():
+            arrays[f"{option}.model_hash"] = np.array(text_labels.model_hash)
+            arrays[f"{option}.hashes"] = text_labels.hashes
+            arrays[f"{option}.labels"] = text_labels.labels
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @staticmethod
+    def load_many(data: bytes) -> Dict[str, 'TextLabels']:
+        """
+        解码dump_many的结果
+        :param data:
+        :return: {检查项: 预测结果}
+        """
+        labels = {}
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            for key in arrays.files:
+                if not key.endswith(".model_hash"):
+                    continue
+                option = key[:-len(".model_hash")]
+                labels[option] = TextLabels(model_hash=str(arrays[key]), hashes=arrays[f"{option}.hashes"],
+                                            labels=arrays[f"{option}.labels"])
+        return labels
+
+
+class IncrementalLabels:
+    """
+    一个检查项的增量预测：上次检查中出现过的段落文本直接使用上次的结果，只预测新的文本，
+    预测后记录本次所有段落文本的结果（供下次增量检查使用）
+    """
+
+    def __init__(self, previous: Optional[TextLabels] = None):
+        """
+        :param previous: 上次检查的预测结果（为None时全部预测）
+        """
+        self.previous = previous
+        self.current: Optional[TextLabels] = None
+        self.reused = 0  # 使用上次结果的文本数
+        self.classified = 0  # 重新预测的文本数
+
+    def classify(self, model_hash: str, texts: List[str],
+                 classify_texts: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        预测段落文本
+        :param model_hash: 当前的模型文件哈希（与上次不同时上次的结果不再使用）
+        :param texts: 段落文本（已去重）
+        :param classify_texts: 预测方法
+        :return: 与texts一一对应的预测结果
+        """
+        hashes = TextLabels.hash_texts(texts)
+        if self.previous is not None and self.previous.model_hash == model_hash:
+            labels = self.previous.lookup(hashes)
+        else:
+            labels = np.full(len(texts), -1, dtype=np.int64)
+        unknown = np.flatnonzero(labels < 0)
+        if len(unknown) > 0:
+            labels[unknown] = classify_texts([texts[index] for index in unknown])
+        self.reused = len(texts) - len(unknown)
+        self.classified = len(unknown)
+        self.current = TextLabels.from_arrays(model_hash, hashes, labels)
+        return labels
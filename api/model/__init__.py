@@ -1,4 +1,5 @@
 from .PdfData import PdfData
 from .Result import Result
 from .ExtractedInfo import ExtractedInfo
-from .Document import Document, DocumentGroup, DocRoot, Paragraph
+from .Document import Document, DocumentGroup, DocRoot, Paragraph, ParagraphBatch
+from .TextLabels import TextLabels, IncrementalLabels
@@ -0,0 +1,310 @@
+import atexit
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional, List
+import requests
+from loguru import logger
+from api.app_const import CALLBACK_ASYNC, CALLBACK_QUEUE_SIZE, CALLBACK_WORKERS, CALLBACK_MAX_ATTEMPTS, \
+    CALLBACK_RETRY_BACKOFF, CALLBACK_SPOOL_DIR, CALLBACK_SPOOL_RETRY_INTERVAL, CALLBACK_SPOOL_MAX_AGE
+from api.utility import HttpUtils, Metrics
+
+# 待发送的回调文件与正在发送中的回调文件的扩展名
+SPOOL_SUFFIX = ".callback"
+SENDING_SUFFIX = ".sending"
+
+
+@dataclass
+class Callback:
+    """
+    一次待发送的回调
+    """
+    notify_url: str
+    task_id: str
+    body: bytes  # 已编码的JSON请求体
+    created_at: float = field(default_factory=time.time)
+    attempts: int = 0  # 已发送次数（写入磁盘时一并保存，重新发送时已达到上限的回调每轮只发送一次）
+    spool_path: Optional[str] = None  # 磁盘中对应的发送中的文件（发送成功后删除）
+
+
+class CallbackDispatcher:
+    """
+    回调发送器：推理线程只把回调放入有界队列即返回，由几个I/O线程负责发送；
+    发送前先写入本地磁盘（发送中），发送成功后删除，进程在发送过程中被终止时由其他进程在超时后恢复发送；
+    发送失败时按指数退避重试，多次失败或队列已满时转为待发送，之后定期重新发送（进程重启后也会继续发送）
+    """
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, workers: int = CALLBACK_WORKERS, queue_size: int = CALLBACK_QUEUE_SIZE,
+                 spool_dir: str = CALLBACK_SPOOL_DIR):
+        self.spool_dir = spool_dir
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._retry_heap: List[tuple] = []  # (下次发送时间, 序号, Callback)
+        self._retry_lock = threading.Condition()
+        self._retry_sequence = 0
+        self._stopped = False
+        os.makedirs(spool_dir, exist_ok=True)
+
+        for index in range(workers):
+            threading.Thread(target=self._work, name=f"callback-{index}", daemon=True).start()
+        threading.Thread(target=self._schedule, name="callback-retry", daemon=True).start()
+
+        Metrics.register_gauge("callback_queue_depth", self._queue.qsize)
+        Metrics.register_gauge("callback_retry_pending", lambda: len(self._retry_heap))
+        Metrics.register_gauge("callback_spooled", self.spooled_count)
+        atexit.register(self.shutdown)
+
+    @classmethod
+    def get_instance(cls) -> 'CallbackDispatcher':
+        """
+        获取进程内共享的回调发送器（gunicorn fork之后在各worker中重新创建，发送线程不能跨fork使用）
+        :return:
+        """
+        pid = os.getpid()
+        if cls._instance is None or cls._instance_pid != pid:
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != pid:
+                    cls._instance = cls()
+                    cls._instance_pid = pid
+        return cls._instance
+
+    def submit(self, notify_url: str, task_id: str, body: bytes) -> None:
+        """
+        提交回调（不等待发送）；未启用异步回调时在当前线程中直接发送
+        :param notify_url:
+        :param task_id:
+        :param body: 已编码的JSON请求体
+        :return:
+        """
+        callback = Callback(notify_url=notify_url, task_id=task_id, body=body)
+        if not CALLBACK_ASYNC:
+            self._deliver(callback)
+            return
+        try:
+            self._queue.put_nowait(callback)
+        except queue.Full:
+            # 队列已满时不阻塞推理线程，先写入磁盘，稍后重新发送
+            logger.warning(f"回调队列已满，写入磁盘稍后发送，task_id：{task_id}")
+            self._spool(callback)
+
+    def _work(self) -> None:
+        while True:
+            callback = self._queue.get()
+            try:
+                self._deliver(callback)
+            except Exception as e:
+                logger.exception(e)
+
+    def _deliver(self, callback: Callback) -> bool:
+        """
+        发送一次回调，失败时安排重试或写入磁盘
+        :param callback:
+        :return: 是否发送成功
+        """
+        callback.attempts += 1
+        if callback.spool_path is None:
+            self._persist_sending(callback)
+        else:
+            self._touch(callback.spool_path)
+        try:
+            response = HttpUtils.post_json(callback.notify_url, callback.body)
+            # 5xx、429、408可能稍后恢复，需要重试；其他状态码视为对方已收到
+            is_delivered = response.status_code < 500 and response.status_code not in (408, 429)
+            error_message = f"状态码: {response.status_code}"
+        except requests.RequestException as e:
+            is_delivered = False
+            error_message = str(e)
+
+        if is_delivered:
+            Metrics.increment("callback_delivered")
+            Metrics.observe("callback_delivery_lag", time.time() - callback.created_at)
+            if callback.spool_path is not None:
+                self._remove(callback.spool_path)
+            logger.info(f"回调结果成功，task_id：{callback.task_id}, 状态码: {response.status_code}")
+            return True
+
+        Metrics.increment("callback_failed_attempts")
+        if callback.attempts < CALLBACK_MAX_ATTEMPTS and CALLBACK_ASYNC and not self._stopped:
+            delay = CALLBACK_RETRY_BACKOFF * 2 ** (callback.attempts - 1)
+            logger.warning(f"回调请求失败，{delay}秒后重试（第{callback.attempts}次），"
+                           f"task_id: {callback.task_id}，详细信息：{error_message}")
+            self._schedule_retry(callback, delay)
+        else:
+            logger.error(f"回调请求失败，写入磁盘稍后发送，task_id: {callback.task_id}，详细信息：{error_message}")
+            self._spool(callback)
+        return False
+
+    def _schedule_retry(self, callback: Callback, delay: float) -> None:
+        with self._retry_lock:
+            self._retry_sequence += 1
+            heapq.heappush(self._retry_heap, (time.monotonic() + delay, self._retry_sequence, callback))
+            self._retry_lock.notify()
+
+    def _schedule(self) -> None:
+        """
+        把到期的重试放回发送队列，并定期重新发送磁盘中的回调
+        :return:
+        """
+        next_spool_time = time.monotonic()
+        while True:
+            due = []
+            with self._retry_lock:
+                now = time.monotonic()
+                while self._retry_heap and self._retry_heap[0][0] <= now:
+                    due.append(heapq.heappop(self._retry_heap)[2])
+                if not due:
+                    wait_time = next_spool_time - now
+                    if self._retry_heap:
+                        wait_time = min(wait_time, self._retry_heap[0][0] - now)
+                    if wait_time > 0:
+                        self._retry_lock.wait(wait_time)
+            for callback in due:
+                try:
+                    self._queue.put_nowait(callback)
+                except queue.Full:
+                    self._spool(callback)
+            if time.monotonic() >= next_spool_time:
+                self._resend_spooled()
+                next_spool_time = time.monotonic() + CALLBACK_SPOOL_RETRY_INTERVAL
+
+    def _write_file(self, callback: Callback, path: str) -> bool:
+        """
+        写入磁盘（第一行为回调信息，之后为请求体）
+        :param callback:
+        :param path: 文件路径
+        :return: 是否写入成功
+        """
+        header = json.dumps({"notify_url": callback.notify_url, "task_id": callback.task_id,
+                             "created_at": callback.created_at, "attempts": callback.attempts},
+                            ensure_ascii=False).encode("utf-8")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(header + b"\n" + callback.body)
+            os.replace(temp_path, path)
+            return True
+        except OSError as e:
+            logger.error(f"回调写入磁盘失败，task_id: {callback.task_id}，详细信息：{str(e)}")
+            self._remove(temp_path)
+            return False
+
+    def _persist_sending(self, callback: Callback) -> None:
+        """
+        首次发送前写入磁盘（发送中），发送成功后删除；写入失败时仍然发送
+        :param callback:
+        :return:
+        """
+        path = os.path.join(self.spool_dir, f"{int(callback.created_at * 1000)}_{uuid.uuid4().hex}{SENDING_SUFFIX}")
+        if self._write_file(callback, path):
+            callback.spool_path = path
+
+    def _spool(self, callback: Callback) -> None:
+        """
+        写入磁盘，等待定期重新发送（已有发送中的文件时改为待发送）
+        :param callback:
+        :return:
+        """
+        path = callback.spool_path
+        if path is None:
+            path = os.path.join(self.spool_dir, f"{int(callback.created_at * 1000)}_{uuid.uuid4().hex}{SPOOL_SUFFIX}")
+        else:
+            path = path[:-len(SENDING_SUFFIX)] + SPOOL_SUFFIX
+        if self._write_file(callback, path):
+            if callback.spool_path is not None and callback.spool_path != path:
+                self._remove(callback.spool_path)
+            Metrics.increment("callback_spooled_total")
+
+    def _resend_spooled(self) -> None:
+        """
+        重新发送磁盘中的回调：先把文件改名为发送中（多个worker进程共用目录时只有一个进程能改名成功），
+        长时间处于发送中的文件（进程在发送时退出）恢复为待发送
+        :return:
+        """
+        try:
+            names = sorted(os.listdir(self.spool_dir))
+        except OSError:
+            return
+        stale_before = time.time() - CALLBACK_SPOOL_RETRY_INTERVAL * 10
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            try:
+                if name.endswith(SENDING_SUFFIX) and os.path.getmtime(path) < stale_before:
+                    os.replace(path, path[:-len(SENDING_SUFFIX)] + SPOOL_SUFFIX)
+                    path = path[:-len(SENDING_SUFFIX)] + SPOOL_SUFFIX
+                elif not name.endswith(SPOOL_SUFFIX):
+                    continue
+                if self._queue.full():
+                    return
+                sending_path = path[:-len(SPOOL_SUFFIX)] + SENDING_SUFFIX
+                os.rename(path, sending_path)
+                os.utime(sending_path)
+                with open(sending_path, "rb") as f:
+                    header, body = f.read().split(b"\n", 1)
+                meta = json.loads(header)
+                if time.time() - meta["created_at"] > CALLBACK_SPOOL_MAX_AGE:
+                    logger.error(f"回调超过最长保留时间仍未发送成功，已放弃，task_id: {meta['task_id']}")
+                    Metrics.increment("callback_expired")
+                    self._remove(sending_path)
+                    continue
+                self._queue.put_nowait(Callback(notify_url=meta["notify_url"], task_id=meta["task_id"], body=body,
+                                                created_at=meta["created_at"], attempts=meta.get("attempts", 0),
+                                                spool_path=sending_path))
+            except (OSError, ValueError, KeyError, queue.Full) as e:
+                # 已被其他进程取走或文件内容不完整
+                logger.debug(f"读取磁盘中的回调失败：{name}，{str(e)}")
+
+    def spooled_count(self) -> int:
+        """
+        磁盘中待发送的回调数
+        :return:
+        """
+        try:
+            return sum(1 for name in os.listdir(self.spool_dir) if name.endswith(SPOOL_SUFFIX))
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """
+        更新发送中的文件的修改时间（等待重试的回调不会被其他进程当作发送时退出而恢复）
+        :param path:
+        :return:
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def shutdown(self) -> None:
+        """
+        进程退出时把尚未发送的回调写入磁盘
+        :return:
+        """
+        self._stopped = True
+        pending = []
+        with self._retry_lock:
+            pending.extend(item[2] for item in self._retry_heap)
+            self._retry_heap.clear()
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for callback in pending:
+            self._spool(callback)
+        if pending:
+            logger.info(f"进程退出，{len(pending)}个未发送的回调已写入磁盘")
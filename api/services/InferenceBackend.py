@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+import numpy as np
+from loguru import logger
+from api.app_const import INFERENCE_BACKEND, INFERENCE_PROCESSES, INFERENCE_BATCH_SIZE, MICRO_BATCH_ENABLED, \
+    InvalidContentType
+from api.services.MicroBatchScheduler import MicroBatchScheduler
+
+# 推理后端类型：当前进程（线程）中执行 / 进程池中执行
+BACKEND_THREAD = "thread"
+BACKEND_PROCESS = "process"
+
+
+def _init_worker() -> None:
+    """
+    进程池worker启动时加载一次模型
+    :return:
+    """
+    from api.services.TechStandardIdentifyService import TechStandardIdentifyService
+    from api.services.TOCIdentifyService import TOCIdentifyService
+    TechStandardIdentifyService()
+    TOCIdentifyService()
+    logger.info(f"推理进程已加载模型，pid: {os.getpid()}")
+
+
+def _predict_in_worker(check_type: str, texts: list[str]) -> np.ndarray:
+    """
+    在进程池worker中预测一批段落
+    :param check_type: 检查类型
+    :param texts: 段落文本
+    :return: 与texts一一对应的预测结果
+    """
+    from api.services.TechStandardIdentifyService import TechStandardIdentifyService
+    from api.services.TOCIdentifyService import TOCIdentifyService
+    if check_type == InvalidContentType.TECH_STANDARD.value:
+        return TechStandardIdentifyService().predict_texts(texts)
+    elif check_type == InvalidContentType.TABLE_OF_CONTENT.value:
+        return TOCIdentifyService().predict_texts(texts)
+    raise ValueError(f"不支持的检查类型: {check_type}")
+
+
+class InferenceBackend:
+    """
+    推理后端（同步与异步请求共用）：
+    thread 在调用方线程中直接预测；process 把段落分批交给进程池，各进程启动时加载一次模型，可以使用容器的全部CPU；
+    启用微批调度时，并发请求的段落先由MicroBatchScheduler合并为一批，再交给thread/process后端预测
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, backend: str = INFERENCE_BACKEND, processes: int = INFERENCE_PROCESSES,
+                 batch_size: int = INFERENCE_BATCH_SIZE, micro_batch: bool = MICRO_BATCH_ENABLED):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.micro_batch = micro_batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if backend == BACKEND_PROCESS:
+            # 使用spawn方式创建进程，避免在多线程进程中fork
+            self._pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker)
+            logger.info(f"使用进程池推理后端，进程数：{processes}")
+
+    @classmethod
+    def get_instance(cls) -> 'InferenceBackend':
+        """
+        获取进程内共享的推理后端
+        :return:
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def predict(self, check_type: str, texts: list[str],
+                local_predict: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """
+        预测一批段落
+        :param check_type: 检查类型
+        :param texts: 段落文本
+        :param local_predict: 在当前进程中预测的方法（thread后端使用）
+        :return: 与texts一一对应的预测结果
+        """
+        if self.micro_batch and texts:
+            return MicroBatchScheduler.get_instance().predict(
+                check_type, texts, lambda batch_texts: self._predict_now(check_type, batch_texts, local_predict))
+        return self._predict_now(check_type, texts, local_predict)
+
+    def _predict_now(self, check_type: str, texts: list[str],
+                     local_predict: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """
+        直接预测一批段落（thread后端在当前线程中预测，process后端分批交给进程池）
+        :param check_type:
+        :param texts:
+        :param local_predict:
+        :return:
+        """
+        if self._pool is None or not texts:
+            return local_predict(texts)
+
+        futures = [self._pool.submit(_predict_in_worker, check_type, texts[start:start + self.batch_size])
+                   for start in range(0, len(texts), self.batch_size)]
+        return np.concatenate([future.result() for future in futures])
+
+    def shutdown(self) -> None:
+        """
+        关闭进程池
+        :return:
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
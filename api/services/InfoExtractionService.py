@@ -1,7 +1,7 @@
 from api.model import PdfData, ExtractedInfo
 from api.utility import UieHelper
-import requests
 import os
+from typing import Optional, Tuple
 import time
 from loguru import logger
 from api.utility import HttpUtils
@@ -22,28 +22,16 @@ class InfoExtractionService(ServiceBase):
         获取指定URL的内容
         :return:
         """
-        try:
-            # 发送GET请求到指定的URL
-            response = requests.get(url)
-
-            # 检查请求是否成功
-            if response.status_code == 200:
-                # 将JSON内容解析为Python对象
-                json_data = response.content.decode(encoding="utf-8")
-                return json_data, None
-            else:
-                return None, f"请求失败。状态码: {response.status_code}"
-        except requests.RequestException as e:
-            return None, f"请求出错: {str(e)}"
-
-    def process(self, schema, url: str, notify_url: str, task_id: str) -> None:
+        return HttpUtils.get_json_from_url(url)
+
+    def process(self, schema, url: str, notify_url: str, task_id: str) -> Tuple[Optional[dict], Optional[str]]:
         """
         信息提取
         :param schema: 要提取的内容
         :param url: 待提取的文件URL
         :param notify_url: 提取完成后要通知的URL
         :param task_id: 任务ID
-        :return: 无返回
+        :return: 提取结果，错误消息（供任务记录保存）
         """
 
         # 先从本地获取文件
@@ -54,7 +42,7 @@ class InfoExtractionService(ServiceBase):
         if data[0] is None:
             # 下载文件失败
             super().notify_cannot_get_file_from_url(url, notify_url, task_id)
-            return
+            return None, "从指定的url下载文件失败"
 
         pdf_data = PdfData.deserialize_from_json(data[0])
 
@@ -72,10 +60,11 @@ class InfoExtractionService(ServiceBase):
         try:
             post_data = {"task_id": task_id, "result": extract_result, "success": True,
                          "message": ""}
-            response = requests.post(notify_url, json=post_data)
-            logger.info(f"回调结果成功，task_id：{task_id}, 状态码: {response.status_code}")
+            self.send_callback(notify_url, task_id, post_data)
+            logger.info(f"回调已提交，task_id：{task_id}")
         except Exception as e:
-            logger.error(f"回调请求失败，task_id: {task_id}，详细信息：{str(e)}")
+            logger.error(f"提交回调失败，task_id: {task_id}，详细信息：{str(e)}")
+        return extract_result, None
 
     def extract_info_from_json(self, items):
         json_dir = "./data"
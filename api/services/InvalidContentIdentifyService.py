@@ -1,11 +1,17 @@
-from api.utility import HttpUtils
-import json
-from api.model import DocRoot
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Dict, Iterator, List
+import requests
+import numpy as np
+from api.utility import HttpUtils, TokenCache, MemoryUtils, RawJson, Metrics, DownloadCache, JsonUtils
+from api.model import DocRoot, DocumentGroup, ParagraphBatch, TextLabels, IncrementalLabels
 from loguru import logger
 from api.services.ServiceBase import ServiceBase
 from api.services.TOCIdentifyService import TOCIdentifyService
 from api.services.TechStandardIdentifyService import TechStandardIdentifyService
-from api.app_const import InvalidContentType
+from api.services.ModelRegistry import ModelRegistry
+from api.app_const import InvalidContentType, DOWNLOAD_CACHE_PARSED, SYNC_STREAM_BATCH_PARAGRAPHS, \
+    BATCH_DOWNLOAD_WORKERS
 
 
 class InvalidContentIdentifyService(ServiceBase):
@@ -13,59 +19,241 @@ class InvalidContentIdentifyService(ServiceBase):
     无效内容识别服务
     """
 
-    def process_sync(self, url: str, notify_url: str, task_id: str, options: [], version: int):
+    # 预检查的错误消息
+    DOWNLOAD_FAILED = "从指定的url下载文件失败"
+    PARSE_FAILED = "解析文件内容失败"
+
+    def load_doc_root(self, url: str, version: int,
+                      conditional: bool = True) -> Tuple[Optional[DocRoot], Optional[str]]:
+        """
+        下载并解析标书文件：边下载边解析，不在内存中保留完整的文件内容与中间字典；
+        已缓存的URL使用条件请求，文件未变化（304）时直接使用缓存的解析结果或缓存的文件内容；
+        缓存在读取前被其他进程淘汰或已损坏时，删除该缓存并重新完整下载
+        :param url:
+        :param version: 2表示数据中不包含GroupId这一层
+        :param conditional: 是否使用缓存进行条件请求
+        :return: 原始标书数据，错误消息（DOWNLOAD_FAILED或PARSE_FAILED）
+        """
+        include_group_id = False if version == 2 else True
+        start_time = time.perf_counter()
+        download_cache = DownloadCache.get_instance()
+        cached = download_cache.lookup(url) if download_cache is not None and conditional else None
+        response, error_message = HttpUtils.get_stream_from_url(
+            url, headers=DownloadCache.conditional_headers(cached) if cached is not None else None)
+        if response is None:
+            logger.error(error_message)
+            return None, self.DOWNLOAD_FAILED
+
+        writer = None
+        cache_failed = False
+        try:
+            if response.status_code == 304:
+                Metrics.increment("download_cache_hits")
+                try:
+                    original_doc_root = self._load_cached_doc_root(download_cache, cached, include_group_id)
+                except OSError as e:
+                    logger.warning(f"读取下载缓存失败：{str(e)}")
+                    original_doc_root = None
+                # 缓存只在解析成功后提交，304时无法解析说明缓存已被淘汰或损坏
+                cache_failed = original_doc_root is None
+            else:
+                Metrics.increment("download_cache_misses")
+                chunks = HttpUtils.iter_chunks(response)
+                writer = download_cache.open_writer(url, response) if download_cache is not None else None
+                if writer is not None:
+                    chunks = writer.tee(chunks)
+                original_doc_root = DocRoot.parse_json_stream(chunks, include_group_id=include_group_id)
+                if writer is not None and original_doc_root is not None:
+                    meta = writer.commit()
+                    if DOWNLOAD_CACHE_PARSED:
+                        download_cache.store_parsed(meta, include_group_id, original_doc_root)
+        except requests.RequestException as e:
+            # 下载过程中连接中断等
+            logger.error(e)
+            return None, self.DOWNLOAD_FAILED
+        finally:
+            if writer is not None:
+                writer.discard()
+            response.close()
+            Metrics.observe("document_load", time.perf_counter() - start_time)
+
+        if cache_failed:
+            Metrics.increment("download_cache_errors")
+            download_cache.remove(cached)
+            return self.load_doc_root(url, version, conditional=False)
+        if original_doc_root is None:
+            return None, self.PARSE_FAILED
+        return original_doc_root, None
+
+    @staticmethod
+    def _load_cached_doc_root(download_cache: DownloadCache, cached: dict,
+                              include_group_id: bool) -> Optional[DocRoot]:
+        """
+        从下载缓存中得到标书数据：优先使用缓存的解析结果，没有时解析缓存的文件内容
+        :param download_cache:
+        :param cached: 缓存信息
+        :param include_group_id:
+        :return:
+        """
+        if DOWNLOAD_CACHE_PARSED:
+            original_doc_root = download_cache.load_parsed(cached, include_group_id)
+            if original_doc_root is not None:
+                Metrics.increment("download_cache_parsed_hits")
+                return original_doc_root
+        original_doc_root = DocRoot.parse_json_stream(DownloadCache.iter_body(cached),
+                                                      include_group_id=include_group_id)
+        if original_doc_root is not None and DOWNLOAD_CACHE_PARSED:
+            download_cache.store_parsed(cached, include_group_id, original_doc_root)
+        return original_doc_root
+
+    def run_checks(self, original_doc_root: DocRoot, options: set, include_group_id: bool,
+                   previous_labels: Optional[Dict[str, TextLabels]] = None,
+                   labels: Optional[Dict[str, TextLabels]] = None) -> dict:
+        """
+        执行各检查项：段落文本只从DocRoot中收集一次，由各检查项共用；
+        相同段落的分词结果经分词缓存在各检查项之间共用，只分词一次
+        :param original_doc_root: 原始标书数据
+        :param options: 检查项
+        :param include_group_id: 序列化时是否包含GroupId
+        :param previous_labels: 上次检查的各检查项的段落预测结果，不为None时为增量检查（只预测内容有变化的段落，
+                                检查结果与完整检查相同）
+        :param labels: 不为None时在其中记录本次各检查项的段落预测结果（供之后的增量检查使用）
+        :return: {检查项: 检查结果}，检查结果为已编码的JSON片段，由JsonUtils.dumps输出
+        """
+        # 模型在后台加载时，等待加载结束后再使用
+        ModelRegistry.wait_for_background_preload()
+        result_dict = {}
+        batch = ParagraphBatch(original_doc_root)
+        for option in options:
+            incremental = None
+            if previous_labels is not None or labels is not None:
+                incremental = IncrementalLabels((previous_labels or {}).get(option))
+            ts_result = self._identify(option, original_doc_root, batch, incremental)
+            if ts_result is not None:
+                result_dict[option] = RawJson(ts_result.to_json_bytes(include_group_id=include_group_id))
+                if labels is not None and incremental.current is not None:
+                    labels[option] = incremental.current
+
+        logger.info(f"分词缓存统计：{TokenCache.get_instance().stats()}")
+        logger.info(f"当前进程内存占用(MB)：{MemoryUtils.get_memory_usage()}")
+        return result_dict
+
+    @staticmethod
+    def _identify(option: str, original_doc_root: DocRoot, batch: ParagraphBatch,
+                  incremental: Optional[IncrementalLabels] = None) -> Optional[DocRoot]:
+        """
+        执行一个检查项
+        :param option: 检查项
+        :param original_doc_root: 原始标书数据
+        :param batch: 从original_doc_root收集的段落批次
+        :param incremental: 增量预测，为None时全部预测
+        :return: 检查结果，检查项无效或检查出现异常时返回None
+        """
+        if option == InvalidContentType.TECH_STANDARD.value:
+            ts_result, ts_message = TechStandardIdentifyService().identify(original_doc_root, batch=batch,
+                                                                           incremental=incremental)
+        elif option == InvalidContentType.TABLE_OF_CONTENT.value:
+            ts_result, ts_message = TOCIdentifyService().identify(original_doc_root, batch=batch,
+                                                                  incremental=incremental)
+        else:
+            return None
+        if incremental is not None and incremental.current is not None:
+            Metrics.increment("incremental_reused_texts", incremental.reused)
+            Metrics.increment("incremental_classified_texts", incremental.classified)
+        return ts_result
+
+    def iter_check_records(self, original_doc_root: DocRoot, options: set, include_group_id: bool,
+                           previous_labels: Optional[Dict[str, TextLabels]] = None) -> Iterator[bytes]:
+        """
+        流式执行各检查项：文档按段落数分批（每批的段落合并预测），每批检查完即输出该批中各文档的检查结果，
+        不在内存中保留整个检查结果
+        :param original_doc_root: 原始标书数据
+        :param options: 检查项（只包含有效的检查项）
+        :param include_group_id: 记录中是否包含GroupId
+        :param previous_labels: 上次检查的各检查项的段落预测结果（增量检查）
+        :return: 每个文档每个检查项一行JSON（NDJSON），{"option", "group_id"(v1), "doc_id", "paragraphs"}；
+                 检查出现异常时抛出RuntimeError（已输出的记录不完整，由调用方输出失败的状态行）
+        """
+        ModelRegistry.wait_for_background_preload()
+        for part_doc_root in original_doc_root.split(SYNC_STREAM_BATCH_PARAGRAPHS):
+            batch = ParagraphBatch(part_doc_root)
+            for option in options:
+                incremental = IncrementalLabels(previous_labels.get(option)) if previous_labels is not None else None
+                ts_result = self._identify(option, part_doc_root, batch, incremental)
+                if ts_result is None:
+                    raise RuntimeError(f"检查项{option}检查失败")
+                for group_key, group_data in ts_result.document_groups.items():
+                    for doc_key, doc_data in group_data.documents.items():
+                        record = {"option": option}
+                        if include_group_id:
+                            record["group_id"] = group_key
+                        record["doc_id"] = doc_key
+                        record["paragraphs"] = doc_data.to_dict()["paragraphs"]
+                        yield JsonUtils.encode(record) + b"\n"
+        logger.info(f"当前进程内存占用(MB)：{MemoryUtils.get_memory_usage()}")
+
+    def process_stream(self, url: str, notify_url: str, task_id: str, options: [], version: int,
+                       previous_labels: Optional[Dict[str, TextLabels]] = None) \
+            -> Tuple[Optional[Iterator[bytes]], Optional[str]]:
+        """
+        同步检查（流式输出）：下载与解析完成后返回逐行输出检查结果的迭代器
+        :param url:
+        :param notify_url:
+        :param task_id:
+        :param options:
+        :param version:
+        :param previous_labels: 上次检查的段落预测结果（增量检查）
+        :return: 检查结果的迭代器，错误消息
+        """
         # 去重
         final_options = set(options)
         # 判断options中至少有一个有效的检查项
         if not final_options & set(InvalidContentType.get_all_values()):
             return None, "未指定有效的检查项"
 
-        data = HttpUtils.get_json_from_url(url)
-        if data[0] is None:
-            # 下载文件失败
-            return None, "从指定的url下载文件失败"
+        # 下载并解析文件
+        original_doc_root, error_message = self.load_doc_root(url, version)  # 原始标书数据
+        if original_doc_root is None:
+            return None, error_message
 
-        is_valid_json: bool = True
-        original_doc_root: DocRoot = None
-        try:
-            # 解析文件
-            json_data = json.loads(data[0])
-            original_doc_root = DocRoot.parse_json_to_dataclasses(json_data,
-                                                                  include_group_id=False if version == 2 else True)  # 原始标书数据
-        except Exception as e:
-            # 解析文件失败
-            logger.error(e)
-            is_valid_json = False
+        include_group_id = False if version == 2 else True  # 记录中是否包含GroupId
+        # 只保留有效的检查项（输出过程中检查项检查失败时整个输出视为失败）
+        final_options &= set(InvalidContentType.get_all_values())
+        return self.iter_check_records(original_doc_root, final_options, include_group_id,
+                                       previous_labels=previous_labels), None
 
-        if not is_valid_json or original_doc_root is None:
-            return None, "解析文件内容失败"
+    def process_sync(self, url: str, notify_url: str, task_id: str, options: [], version: int,
+                     previous_labels: Optional[Dict[str, TextLabels]] = None):
+        # 去重
+        final_options = set(options)
+        # 判断options中至少有一个有效的检查项
+        if not final_options & set(InvalidContentType.get_all_values()):
+            return None, "未指定有效的检查项"
+
+        # 下载并解析文件
+        original_doc_root, error_message = self.load_doc_root(url, version)  # 原始标书数据
+        if original_doc_root is None:
+            return None, error_message
 
         # 通过预检查（文件下载与解析），开始逐项进行检查
-        result_dict = {}
         include_group_id = False if version == 2 else True  # 序列化时是否包含GroupId
-
-        for option in final_options:
-            if option == InvalidContentType.TECH_STANDARD.value:
-                tech_standard_identify = TechStandardIdentifyService()
-                ts_result, ts_message = tech_standard_identify.identify(original_doc_root)
-                if ts_result is not None:
-                    result_dict[option] = DocRoot.serialize(ts_result, include_group_id=include_group_id)
-            elif option == InvalidContentType.TABLE_OF_CONTENT.value:
-                toc_identify = TOCIdentifyService()
-                ts_result, ts_message = toc_identify.identify(original_doc_root)
-                if ts_result is not None:
-                    result_dict[option] = DocRoot.serialize(ts_result, include_group_id=include_group_id)
+        result_dict = self.run_checks(original_doc_root, final_options, include_group_id,
+                                      previous_labels=previous_labels)
 
         return result_dict, None
 
-    def process(self, url: str, notify_url: str, task_id: str, options: [], version: int) -> None:
+    def process(self, url: str, notify_url: str, task_id: str, options: [], version: int,
+                previous_labels: Optional[Dict[str, TextLabels]] = None,
+                labels: Optional[Dict[str, TextLabels]] = None) -> Tuple[Optional[dict], Optional[str]]:
         """
-        处理（调用相应的服务）
+        处理（调用相应的服务），并回调通知结果
         :param url:
         :param notify_url:
         :param task_id:
         :param options:
-        :return:
+        :param previous_labels: 上次检查的段落预测结果（增量检查）
+        :param labels: 不为None时在其中记录本次的段落预测结果
+        :return: 检查结果，错误消息（供任务记录保存）
         """
 
         # 去重
@@ -73,42 +261,146 @@ class InvalidContentIdentifyService(ServiceBase):
         # 判断options中至少有一个有效的检查项
         if not final_options & set(InvalidContentType.get_all_values()):
             super().notify_bad_request(url, notify_url, task_id, error_message="未指定有效的检查项")
-            return
+            return None, "未指定有效的检查项"
 
-        data = HttpUtils.get_json_from_url(url)
-        if data[0] is None:
-            # 下载文件失败
+        # 下载并解析文件
+        original_doc_root, error_message = self.load_doc_root(url, version)  # 原始标书数据
+        if error_message == self.DOWNLOAD_FAILED:
             super().notify_cannot_get_file_from_url(url, notify_url, task_id)
-            return
-
-        is_valid_json: bool = True
-        original_doc_root: DocRoot = None
-        try:
-            # 解析文件
-            json_data = json.loads(data[0])
-            original_doc_root = DocRoot.parse_json_to_dataclasses(json_data, include_group_id=False if version == 2 else True)  # 原始标书数据
-        except Exception as e:
-            # 解析文件失败
-            logger.error(e)
-            is_valid_json = False
-
-        if not is_valid_json or original_doc_root is None:
+            return None, error_message
+        if original_doc_root is None:
             super().notify_cannot_parse_file_content(url, notify_url, task_id)
-            return
+            return None, error_message
 
         # 通过预检查（文件下载与解析），开始逐项进行检查
-        result_dict = {}
         include_group_id = False if version == 2 else True  # 序列化时是否包含GroupId
-        for option in final_options:
-            if option == InvalidContentType.TECH_STANDARD.value:
-                tech_standard_identify = TechStandardIdentifyService()
-                ts_result, ts_message = tech_standard_identify.identify(original_doc_root)
-                if ts_result is not None:
-                    result_dict[option] = DocRoot.serialize(ts_result, include_group_id)
-            elif option == InvalidContentType.TABLE_OF_CONTENT.value:
-                toc_identify = TOCIdentifyService()
-                ts_result, ts_message = toc_identify.identify(original_doc_root)
-                if ts_result is not None:
-                    result_dict[option] = DocRoot.serialize(ts_result, include_group_id)
+        result_dict = self.run_checks(original_doc_root, final_options, include_group_id,
+                                      previous_labels=previous_labels, labels=labels)
 
         super().notify_success_with_data(notify_url, task_id, result_dict)
+        return result_dict, None
+
+    def run_batch_checks(self, doc_roots: Dict[int, DocRoot], options: Dict[int, set], include_group_id: bool,
+                         labels: Optional[Dict[int, Dict[str, TextLabels]]] = None) -> Dict[int, dict]:
+        """
+        对多份标书执行检查：每个检查项把要求该检查项的所有标书的段落合并为一批进行预测（去重、预测结果缓存与
+        模型预测在整批上进行），再按方案组拆分回各标书
+        :param doc_roots: {序号: 原始标书数据}
+        :param options: {序号: 检查项}
+        :param include_group_id: 序列化时是否包含GroupId
+        :param labels: 不为None时在其中记录各标书本次各检查项的段落预测结果，{序号: {检查项: 预测结果}}
+        :return: {序号: {检查项: 检查结果}}
+        """
+        ModelRegistry.wait_for_background_preload()
+        result_dicts = {index: {} for index in doc_roots}
+        text_hashes: Dict[int, np.ndarray] = {}
+        if labels is not None:
+            # 各标书的段落文本哈希（包含去掉前后空白字符后的文本，用于从整批的预测结果中取出各标书的部分）
+            for index, doc_root in doc_roots.items():
+                texts = ParagraphBatch(doc_root).texts
+                text_hashes[index] = TextLabels.hash_texts(texts + [text.strip() for text in texts])
+                labels[index] = {}
+        for option in set().union(*options.values()):
+            indexes = [index for index in doc_roots if option in options[index]]
+            # 各标书的方案组合并到一个DocRoot中（方案组的键改为序号，避免不同标书的键重复）
+            merged_groups: Dict[str, DocumentGroup] = {}
+            owners: Dict[str, Tuple[int, str]] = {}  # 合并后的键 -> (标书序号, 原来的键)
+            for index in indexes:
+                for group_key, group_data in doc_roots[index].document_groups.items():
+                    merged_key = str(len(merged_groups))
+                    merged_groups[merged_key] = group_data
+                    owners[merged_key] = (index, group_key)
+            merged_doc_root = DocRoot(document_groups=merged_groups)
+            incremental = IncrementalLabels() if labels is not None else None
+            ts_result = self._identify(option, merged_doc_root, ParagraphBatch(merged_doc_root), incremental)
+            if ts_result is None:
+                continue
+            if incremental is not None and incremental.current is not None:
+                for index in indexes:
+                    labels[index][option] = incremental.current.select(text_hashes[index])
+
+            task_groups: Dict[int, Dict[str, DocumentGroup]] = {index: {} for index in indexes}
+            for merged_key, group_data in ts_result.document_groups.items():
+                index, group_key = owners[merged_key]
+                task_groups[index][group_key] = group_data
+            for index, document_groups in task_groups.items():
+                result_dicts[index][option] = RawJson(DocRoot(document_groups=document_groups).to_json_bytes(
+                    include_group_id=include_group_id))
+
+        logger.info(f"分词缓存统计：{TokenCache.get_instance().stats()}")
+        logger.info(f"当前进程内存占用(MB)：{MemoryUtils.get_memory_usage()}")
+        return result_dicts
+
+    def process_batch(self, items: List[dict], version: int, batch_id: str, notify_url: Optional[str] = None,
+                      combined_callback: bool = False, labels: Optional[Dict[int, Dict[str, TextLabels]]] = None) \
+            -> List[Tuple[Optional[dict], Optional[str]]]:
+        """
+        批量处理：同时下载多份标书，合并检查，并回调通知结果（每个任务分别回调，或整批合并为一次回调）
+        :param items: 任务列表，[{"task_id", "url", "options", "notify_url"}, ...]
+        :param version:
+        :param batch_id: 批次ID
+        :param notify_url: 合并回调的地址
+        :param combined_callback: 是否合并回调（否则按各任务的notify_url分别回调）
+        :param labels: 不为None时在其中记录各任务本次的段落预测结果，{items中的序号: {检查项: 预测结果}}
+        :return: 与items一一对应的（检查结果，错误消息）
+        """
+        results: List[Tuple[Optional[dict], Optional[str]]] = [(None, None)] * len(items)
+        valid_options = set(InvalidContentType.get_all_values())
+        options = {index: set(item["options"]) for index, item in enumerate(items)}
+        to_load = []
+        for index, item_options in options.items():
+            if item_options & valid_options:
+                to_load.append(index)
+            else:
+                results[index] = (None, "未指定有效的检查项")
+
+        # 同时下载并解析各标书
+        doc_roots: Dict[int, DocRoot] = {}
+        if to_load:
+            with ThreadPoolExecutor(max_workers=min(BATCH_DOWNLOAD_WORKERS, len(to_load)),
+                                    thread_name_prefix="batch-download") as pool:
+                loaded = list(pool.map(lambda index: self.load_doc_root(items[index]["url"], version), to_load))
+            for index, (original_doc_root, error_message) in zip(to_load, loaded):
+                if original_doc_root is None:
+                    results[index] = (None, error_message)
+                else:
+                    doc_roots[index] = original_doc_root
+        logger.info(f"批量任务下载完成，batch_id：{batch_id}，任务数：{len(items)}，下载并解析成功：{len(doc_roots)}")
+
+        # 通过预检查的标书合并检查
+        include_group_id = False if version == 2 else True  # 序列化时是否包含GroupId
+        if doc_roots:
+            check_results = self.run_batch_checks(doc_roots, {index: options[index] for index in doc_roots},
+                                                  include_group_id, labels=labels)
+            for index, result_dict in check_results.items():
+                results[index] = (result_dict, None)
+
+        if combined_callback:
+            self.notify_batch(notify_url, batch_id,
+                              [{"task_id": item["task_id"], "result": result if result is not None else "",
+                                "success": result is not None, "message": "成功" if result is not None else message}
+                               for item, (result, message) in zip(items, results)])
+        else:
+            for item, (result, message) in zip(items, results):
+                self.notify_result(item["url"], item["notify_url"], item["task_id"], result, message)
+        return results
+
+    def notify_result(self, url: str, notify_url: str, task_id: str, result: Optional[dict],
+                      error_message: Optional[str]) -> None:
+        """
+        按检查结果或错误消息回调
+        :param url:
+        :param notify_url:
+        :param task_id:
+        :param result: 检查结果
+        :param error_message: 错误消息
+        :return:
+        """
+        if result is not None:
+            super().notify_success_with_data(notify_url, task_id, result)
+        elif error_message == self.DOWNLOAD_FAILED:
+            super().notify_cannot_get_file_from_url(url, notify_url, task_id)
+        elif error_message == self.PARSE_FAILED:
+            super().notify_cannot_parse_file_content(url, notify_url, task_id)
+        else:
+            super().notify_bad_request(url, notify_url, task_id, error_message=error_message)
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from loguru import logger
+from api.app_const import MICRO_BATCH_LANES, MICRO_BATCH_WINDOW_MS, MICRO_BATCH_MAX_TEXTS, MICRO_BATCH_WORKERS
+from api.utility import Metrics
+
+
+class _PendingPrediction:
+    """
+    一个请求提交的待预测段落
+    """
+    __slots__ = ("texts", "predict_batch", "submitted_at", "done", "result", "error")
+
+    def __init__(self, texts: List[str], predict_batch: Callable[[List[str]], np.ndarray]):
+        self.texts = texts
+        self.predict_batch = predict_batch
+        self.submitted_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class _Lane:
+    """
+    一个检查类型的微批队列：第一个请求到达后等待时间窗口，期间到达的请求合并为一批（段落数达到上限时立即执行），
+    去重后一次预测，再按各请求的段落数拆分结果；段落数达到上限的请求合并没有收益，不进入队列
+    """
+
+    def __init__(self, check_type: str, window_ms: float, max_texts: int, workers: int):
+        self.check_type = check_type
+        self.window = window_ms / 1000
+        self.max_texts = max_texts
+        self._queue: deque[_PendingPrediction] = deque()
+        self._queued_texts = 0
+        self._condition = threading.Condition()
+        for index in range(max(workers, 1)):
+            threading.Thread(target=self._run, name=f"micro-batch-{check_type}-{index}", daemon=True).start()
+        Metrics.register_gauge(f"micro_batch_queue_{check_type}", lambda: len(self._queue))
+
+    def submit(self, texts: List[str], predict_batch: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        提交段落并等待预测结果
+        :param texts:
+        :param predict_batch: 预测一批段落的方法
+        :return: 与texts一一对应的预测结果
+        """
+        if len(texts) >= self.max_texts:
+            # 大请求在请求线程中直接预测，不占用队列，也不让小请求排在其后等待
+            Metrics.increment("micro_batch_bypassed")
+            return np.asarray(predict_batch(texts))
+        pending = _PendingPrediction(texts, predict_batch)
+        with self._condition:
+            self._queue.append(pending)
+            self._queued_texts += len(texts)
+            self._condition.notify_all()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _take_batch(self) -> List[_PendingPrediction]:
+        """
+        等待并取出一批请求（至少一个）
+        :return:
+        """
+        with self._condition:
+            while True:
+                while not self._queue:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.window
+                while self._queue and self._queued_texts < self.max_texts:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                # 多个线程时，等待期间请求可能已被其他线程取走
+                if self._queue:
+                    break
+            batch = [self._queue.popleft()]
+            batch_texts = len(batch[0].texts)
+            while self._queue and batch_texts + len(self._queue[0].texts) <= self.max_texts:
+                batch_texts += len(self._queue[0].texts)
+                batch.append(self._queue.popleft())
+            self._queued_texts -= batch_texts
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            try:
+                self._execute(batch)
+            except Exception as e:
+                logger.exception(e)
+                for pending in batch:
+                    if pending.result is None:
+                        pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def _execute(self, batch: List[_PendingPrediction]) -> None:
+        """
+        合并预测一批请求的段落（不同请求中相同的段落只预测一次）
+        :param batch:
+        :return:
+        """
+        start_time = time.perf_counter()
+        for pending in batch:
+            Metrics.observe("micro_batch_wait", start_time - pending.submitted_at)
+        index_of: Dict[str, int] = {}
+        inverse = np.fromiter((index_of.setdefault(text, len(index_of)) for pending in batch for text in pending.texts),
+                              dtype=np.intp)
+        try:
+            labels = np.asarray(batch[0].predict_batch(list(index_of)))[inverse]
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+            return
+        offset = 0
+        for pending in batch:
+            pending.result = labels[offset:offset + len(pending.texts)]
+            offset += len(pending.texts)
+        Metrics.increment("micro_batches")
+        Metrics.increment("micro_batch_requests", len(batch))
+        Metrics.increment("micro_batch_texts", len(index_of))
+        if len(batch) > 1:
+            logger.info(f"微批预测，检查类型：{self.check_type}，合并请求数：{len(batch)}，段落数：{len(inverse)}，"
+                        f"去重后：{len(index_of)}，耗时：{time.perf_counter() - start_time:.3f}秒")
+
+
+class MicroBatchScheduler:
+    """
+    推理微批调度：并发的检查任务各自的段落在很短的时间窗口内汇集为一批，一次向量化与预测，再把结果分发回各任务，
+    避免每个任务分别调用模型而重复承担每次预测的固定开销；每个检查类型（lane）的时间窗口、批次上限与线程数可以单独设置
+    """
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, lanes: Dict[str, dict] = MICRO_BATCH_LANES):
+        self.lane_settings = lanes
+        self._lanes: Dict[str, _Lane] = {}
+        self._lanes_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'MicroBatchScheduler':
+        """
+        获取进程内共享的调度器（gunicorn fork之后在各worker中重新创建，预测线程不能跨fork使用）
+        :return:
+        """
+        pid = os.getpid()
+        if cls._instance is None or cls._instance_pid != pid:
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != pid:
+                    cls._instance = cls()
+                    cls._instance_pid = pid
+        return cls._instance
+
+    def _get_lane(self, check_type: str) -> _Lane:
+        lane = self._lanes.get(check_type)
+        if lane is None:
+            with self._lanes_lock:
+                lane = self._lanes.get(check_type)
+                if lane is None:
+                    settings = self.lane_settings.get(check_type, {})
+                    lane = _Lane(check_type,
+                                 window_ms=settings.get("window_ms", MICRO_BATCH_WINDOW_MS),
+                                 max_texts=settings.get("max_texts", MICRO_BATCH_MAX_TEXTS),
+                                 workers=settings.get("workers", MICRO_BATCH_WORKERS))
+                    self._lanes[check_type] = lane
+        return lane
+
+    def predict(self, check_type: str, texts: List[str],
+                predict_batch: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        提交段落，与同一时间窗口内其他请求的段落合并预测
+        :param check_type: 检查类型
+        :param texts: 段落文本
+        :param predict_batch: 预测一批段落的方法
+        :return: 与texts一一对应的预测结果
+        """
+        return self._get_lane(check_type).submit(texts, predict_batch)
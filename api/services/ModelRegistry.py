@@ -0,0 +1,145 @@
+import gc
+import threading
+import time
+from typing import Dict, List
+from loguru import logger
+from api.services.TechStandardIdentifyService import TechStandardIdentifyService
+from api.services.TOCIdentifyService import TOCIdentifyService
+from api.utility import MemoryUtils, TokenCache
+from api.app_const import InvalidContentType, READY_REQUIRED_CHECKS, MODEL_RETRY_INTERVAL
+
+
+class ModelRegistry:
+    """
+    模型注册表：在gunicorn master进程中（--preload / preload_app）fork之前一次性加载所有模型，
+    worker进程通过写时复制共享这些内存页，不再在首个请求中加载模型；
+    加载后使用内置样例对每个检查项进行一次预热预测，按检查项记录是否就绪（/ready），
+    未就绪的检查项定期重新加载模型，不影响已就绪的检查项
+    """
+    _lock = threading.Lock()
+    _is_loaded = False
+    _check_ready: Dict[str, bool] = {}  # 检查项 -> 是否就绪
+    _preload_thread: threading.Thread = None
+    _retry_thread: threading.Thread = None
+    _last_retry_time = 0.0
+
+    # 各检查项的识别服务
+    SERVICES = {InvalidContentType.TECH_STANDARD.value: TechStandardIdentifyService,
+                InvalidContentType.TABLE_OF_CONTENT.value: TOCIdentifyService}
+
+    # 预热用的内置样例段落
+    WARMUP_TEXTS = ["GB50300-2013《建筑工程施工质量验收统一标准》",
+                    "《中华人民共和国建筑法》",
+                    "第一章 工程概况",
+                    "认真落实施工组织设计中安全技术管理的各项措施，严格执行安全技术措施审批制度。"]
+
+    @classmethod
+    def preload(cls) -> None:
+        """
+        加载所有模型与jieba词典并预热（重复调用时只加载一次）
+        :return:
+        """
+        with cls._lock:
+            if cls._is_loaded:
+                return
+            start_time = time.perf_counter()
+            TokenCache.initialize_dictionary()
+            cls._check_ready = {check_type: cls._warmup(service_class())
+                                for check_type, service_class in cls.SERVICES.items()}
+            cls._last_retry_time = time.monotonic()
+
+            # 把已加载的对象移出垃圾回收的扫描范围，避免fork后GC改写这些对象所在的内存页而失去共享
+            gc.collect()
+            gc.freeze()
+            cls._is_loaded = True
+            logger.info(f"模型预加载完成，耗时：{time.perf_counter() - start_time:.2f}秒，各检查项就绪：{cls._check_ready}，"
+                        f"内存占用(MB)：{MemoryUtils.get_memory_usage()}")
+
+    @classmethod
+    def _warmup(cls, service) -> bool:
+        """
+        使用内置样例预测一次（直接调用模型，不经过预测结果缓存与推理进程池）
+        :param service: 识别服务
+        :return: 是否预热成功
+        """
+        try:
+            service.predict_texts(cls.WARMUP_TEXTS)
+            return True
+        except Exception as e:
+            logger.error(f"模型预热失败，{type(service).__name__}：{str(e)}")
+            return False
+
+    @classmethod
+    def retry_failed(cls) -> None:
+        """
+        重新加载并预热未就绪的检查项的模型（如模型文件在启动后才放入）
+        :return:
+        """
+        with cls._lock:
+            cls._last_retry_time = time.monotonic()
+            for check_type in cls.not_ready_checks():
+                service = cls.SERVICES[check_type]()
+                with service._lock:
+                    service._load_model()
+                cls._check_ready[check_type] = cls._warmup(service)
+                logger.info(f"重新加载模型，检查项：{check_type}，就绪：{cls._check_ready[check_type]}")
+
+    @classmethod
+    def retry_failed_in_background(cls) -> None:
+        """
+        有未就绪的检查项且距上次加载超过MODEL_RETRY_INTERVAL时，在后台线程中重新加载（不阻塞调用方）
+        :return:
+        """
+        if not cls._is_loaded or not cls.not_ready_checks():
+            return
+        if time.monotonic() - cls._last_retry_time < MODEL_RETRY_INTERVAL:
+            return
+        if cls._retry_thread is not None and cls._retry_thread.is_alive():
+            return
+        cls._retry_thread = threading.Thread(target=cls.retry_failed, name="model-retry", daemon=True)
+        cls._retry_thread.start()
+
+    @classmethod
+    def start_background_preload(cls) -> None:
+        """
+        在后台线程中加载模型（不使用预加载时，应用可以先启动，就绪前/ready返回503）
+        :return:
+        """
+        cls._preload_thread = threading.Thread(target=cls.preload, name="model-preload", daemon=True)
+        cls._preload_thread.start()
+
+    @classmethod
+    def wait_for_background_preload(cls) -> None:
+        """
+        等待后台加载结束（请求线程如与后台线程同时导入sklearn等模块，可能在导入锁上相互等待而死锁）
+        :return:
+        """
+        if cls._preload_thread is not None:
+            cls._preload_thread.join()
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        return cls._is_loaded
+
+    @classmethod
+    def check_status(cls) -> Dict[str, bool]:
+        """
+        各检查项是否就绪
+        :return:
+        """
+        return {check_type: cls._check_ready.get(check_type, False) for check_type in cls.SERVICES}
+
+    @classmethod
+    def not_ready_checks(cls) -> List[str]:
+        return [check_type for check_type, is_ready in cls.check_status().items() if not is_ready]
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        """
+        是否就绪：READY_REQUIRED_CHECKS中的检查项全部就绪（未设置时任一检查项就绪即可）
+        :return:
+        """
+        status = cls.check_status()
+        if READY_REQUIRED_CHECKS:
+            return all(status.get(check_type, False) for check_type in READY_REQUIRED_CHECKS)
+        return any(status.values())
@@ -1,5 +1,6 @@
-import requests
 from loguru import logger
+from api.utility import JsonUtils
+from api.services.CallbackDispatcher import CallbackDispatcher
 
 
 class ServiceBase:
@@ -7,6 +8,20 @@ class ServiceBase:
     服务基类
     """
 
+    @staticmethod
+    def send_callback(notify_url: str, task_id: str, post_data: dict) -> None:
+        """
+        提交回调（由回调发送器异步发送，请求体由JsonUtils直接编码为字节，检查结果片段不再重新编码）
+        :param notify_url:
+        :param task_id:
+        :param post_data:
+        :return:
+        """
+        if not notify_url:
+            # 未指定回调地址（客户端通过任务查询接口获取结果）
+            return
+        CallbackDispatcher.get_instance().submit(notify_url, task_id, JsonUtils.dumps(post_data))
+
     def notify_cannot_get_file_from_url(self, url: str, notify_url: str, task_id: str) -> None:
         """
         找不到指定的文件
@@ -18,19 +33,19 @@ class ServiceBase:
         try:
             post_data = {"task_id": task_id, "result": "", "success": False,
                          "message": "从指定的url下载文件失败"}
-            requests.post(notify_url, json=post_data)
-            logger.warning(f"回调结果：成功；回调原因：从指定的url下载文件失败，task_id：{task_id}, url: {url}")
+            self.send_callback(notify_url, task_id, post_data)
+            logger.warning(f"回调已提交；回调原因：从指定的url下载文件失败，task_id：{task_id}, url: {url}")
         except Exception as e:
-            logger.error(f"回调请求失败，task_id: {task_id}，详细信息：{str(e)}")
+            logger.error(f"提交回调失败，task_id: {task_id}，详细信息：{str(e)}")
 
     def notify_cannot_parse_file_content(self, url: str, notify_url: str, task_id: str) -> None:
         try:
             post_data = {"task_id": task_id, "result": "", "success": False,
                          "message": "解析文件内容失败"}
-            requests.post(notify_url, json=post_data)
-            logger.warning(f"回调结果：成功；回调原因：解析文件内容失败，task_id：{task_id}, url: {url}")
+            self.send_callback(notify_url, task_id, post_data)
+            logger.warning(f"回调已提交；回调原因：解析文件内容失败，task_id：{task_id}, url: {url}")
         except Exception as e:
-            logger.error(f"回调请求失败，task_id: {task_id}，详细信息：{str(e)}")
+            logger.error(f"提交回调失败，task_id: {task_id}，详细信息：{str(e)}")
 
     def notify_bad_request(self, url: str, notify_url: str, task_id: str, error_message: str) -> None:
         """
@@ -44,10 +59,10 @@ class ServiceBase:
         try:
             post_data = {"task_id": task_id, "result": "", "success": False,
                          "message": error_message}
-            requests.post(notify_url, json=post_data)
-            logger.warning(f"回调结果：成功；回调原因：请求错误（{error_message}），task_id：{task_id}, url: {url}")
+            self.send_callback(notify_url, task_id, post_data)
+            logger.warning(f"回调已提交；回调原因：请求错误（{error_message}），task_id：{task_id}, url: {url}")
         except Exception as e:
-            logger.error(f"回调请求失败，task_id: {task_id}，详细信息：{str(e)}")
+            logger.error(f"提交回调失败，task_id: {task_id}，详细信息：{str(e)}")
 
     def notify_fail_by_self_error(self, url: str, notify_url: str, task_id: str) -> None:
         """
@@ -60,10 +75,10 @@ class ServiceBase:
         try:
             post_data = {"task_id": task_id, "result": "", "success": False,
                          "message": "处理请求的内容失败"}
-            response = requests.post(notify_url, json=post_data)
-            logger.warning(f"回调结果：成功；回调原因：处理请求的内容失败，task_id：{task_id}, url: {url}")
+            self.send_callback(notify_url, task_id, post_data)
+            logger.warning(f"回调已提交；回调原因：处理请求的内容失败，task_id：{task_id}, url: {url}")
         except Exception as e:
-            logger.error(f"回调请求失败，task_id: {task_id}，详细信息：{str(e)}")
+            logger.error(f"提交回调失败，task_id: {task_id}，详细信息：{str(e)}")
 
     def notify_success_with_data(self, notify_url: str, task_id: str, data) -> None:
         """
@@ -75,7 +90,22 @@ class ServiceBase:
         """
         try:
             post_data = {"task_id": task_id, "result": data, "success": True, "message": "成功"}
-            response = requests.post(notify_url, json=post_data)
-            logger.info(f"回调结果成功，task_id：{task_id}, 状态码: {response.status_code}")
+            self.send_callback(notify_url, task_id, post_data)
+            logger.info(f"回调已提交，task_id：{task_id}")
+        except Exception as e:
+            logger.error(f"提交回调失败，task_id: {task_id}，详细信息：{str(e)}")
+
+    def notify_batch(self, notify_url: str, batch_id: str, task_results: list) -> None:
+        """
+        批量任务的合并回调（一次回调包含所有任务的结果，每个任务的格式与单个任务的回调相同）
+        :param notify_url:
+        :param batch_id: 批次ID
+        :param task_results: [{"task_id", "result", "success", "message"}, ...]
+        :return:
+        """
+        try:
+            post_data = {"batch_id": batch_id, "tasks": task_results, "success": True, "message": "成功"}
+            self.send_callback(notify_url, batch_id, post_data)
+            logger.info(f"批量任务的回调已提交，batch_id：{batch_id}，任务数：{len(task_results)}")
         except Exception as e:
-            logger.error(f"回调请求失败，task_id: {task_id}，详细信息：{str(e)}")
+            logger.error(f"提交回调失败，batch_id: {batch_id}，详细信息：{str(e)}")
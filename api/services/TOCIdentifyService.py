@@ -1,8 +1,12 @@
-import joblib
-from api.model import DocRoot, DocumentGroup, Document
+import threading
+import numpy as np
+from api.model import DocRoot, ParagraphBatch, IncrementalLabels
 from loguru import logger
 from numpy import ndarray
 from api.services.ServiceBase import ServiceBase
+from api.services.InferenceBackend import InferenceBackend
+from api.utility import PredictionCache, ModelArtifact
+from api.app_const import InvalidContentType
 import os
 from typing import Optional, Tuple
 
@@ -10,17 +14,22 @@ from typing import Optional, Tuple
 class TOCIdentifyService(ServiceBase):
     _instance = None
     _is_initialized = False
+    _lock = threading.Lock()  # 防止并发的首次请求重复加载模型
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(TOCIdentifyService, cls).__new__(cls)
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(TOCIdentifyService, cls).__new__(cls)
         return cls._instance
 
     def __init__(self):
         logger.info("实例化TOCIdentifyService")
         if not self._is_initialized:
-            self._load_model()
-            TOCIdentifyService._is_initialized = True
+            with self._lock:
+                if not self._is_initialized:
+                    self._load_model()
+                    TOCIdentifyService._is_initialized = True
 
     def _load_model(self) -> None:
         """
@@ -32,9 +41,15 @@ class TOCIdentifyService(ServiceBase):
             # 加载模型
             logger.info(f"当前目录： {os.getcwd()}")
             prefix = "../" if os.getcwd().endswith("api") else ""
-            self.model = joblib.load(prefix + 'training/saved_models/toc_model.joblib')
+            model_path = prefix + 'training/saved_models/toc_model.joblib'
+            vectorizer_path = prefix + 'training/saved_models/toc_vectorizer.joblib'
+            # 存在可内存映射版本时以mmap方式加载，多个进程共享同一份page cache
+            self.model = ModelArtifact.load(model_path)
             # 加载vectorizer
-            self.vectorizer = joblib.load(prefix + 'training/saved_models/toc_vectorizer.joblib')
+            self.vectorizer = ModelArtifact.load(vectorizer_path)
+            # 模型文件哈希（用于预测结果缓存，模型更新后旧的缓存自动失效）
+            self.model_hash = PredictionCache.hash_files([ModelArtifact.resolve(model_path),
+                                                          ModelArtifact.resolve(vectorizer_path)])
             logger.info(f"加载模型成功")
         except Exception as e:
             logger.exception(e)
@@ -51,34 +66,66 @@ class TOCIdentifyService(ServiceBase):
         content_vectored = self.vectorizer.transform(content)
         return self.model.predict(content_vectored)
 
-    def identify(self, original_doc_root: DocRoot) -> Tuple[Optional[DocRoot], Optional[str]]:
+    def predict_texts(self, texts: list[str]) -> ndarray:
         """
-        目录识别
+        对一批段落文本进行预测（一次向量化与预测）
+        :param texts: 段落文本
+        :return: 与texts一一对应的预测结果
+        """
+        if not texts:
+            return np.zeros(0, dtype=int)
+
+        # 文本转为向量
+        para_vectors = self.vectorizer.transform(texts)
+        # 使用模型预测
+        return self.model.predict(para_vectors)
+
+    def predict_with_backend(self, texts: list[str]) -> ndarray:
+        """
+        经推理后端预测（thread后端在当前线程中预测，process后端分批交给进程池）
+        :param texts: 段落文本
+        :return: 与texts一一对应的预测结果
+        """
+        return InferenceBackend.get_instance().predict(InvalidContentType.TABLE_OF_CONTENT.value, texts,
+                                                       self.predict_texts)
+
+    def classify_texts(self, texts: list[str]) -> ndarray:
+        """
+        对一批段落文本进行预测（优先使用预测结果缓存）
+        :param texts: 段落文本
+        :return: 与texts一一对应的预测结果
+        """
+        cache = PredictionCache.get_instance()
+        if cache is None or not texts:
+            return self.predict_with_backend(texts)
+        return cache.classify(InvalidContentType.TABLE_OF_CONTENT.value, self.model_hash, texts,
+                              self.predict_with_backend)
+
+    def identify(self, original_doc_root: DocRoot,
+                 batch: Optional[ParagraphBatch] = None,
+                 incremental: Optional[IncrementalLabels] = None) -> Tuple[Optional[DocRoot], Optional[str]]:
+        """
+        目录识别（整个DocRoot的段落合并为一批进行预测，再按偏移量回填到各文档）
         :param original_doc_root:
+        :param batch: 已从original_doc_root收集的段落批次（多个检查项共用），为None时重新收集
+        :param incremental: 增量预测（只预测上次检查中没有出现过的段落文本），为None时全部预测
         :return:
         """
-        target_doc_root = DocRoot(document_groups={})  # 检查结果
         try:
-            for group_key, group_data in original_doc_root.document_groups.items():
-                # 方案组
-                target_doc_group_data = DocumentGroup(documents={})
-                for doc_key, doc_data in group_data.documents.items():
-                    # 文档
-                    target_doc_data = Document(paragraphs=[])
-                    # 将原文档中的段落转化为字符串列表以准备检查
-                    doc_paragraphs: list[str] = [para.text for para in doc_data.paragraphs]
-                    # 文本转为向量
-                    para_vectors = self.vectorizer.transform(doc_paragraphs)
-                    # 使用模型预测
-                    doc_check_result: ndarray = self.model.predict(para_vectors)
-                    for index, value in enumerate(doc_check_result):
-                        if value == 1:
-                            # 往结果对象中添加原文档中的段落
-                            target_doc_data.paragraphs.append(doc_data.paragraphs[index])
-                    # 当前文档已检查完，向方案组中添加当前文档的检查结果
-                    target_doc_group_data.documents[doc_key] = target_doc_data
-                # 添加方案组
-                target_doc_root.document_groups[group_key] = target_doc_group_data
+            # 将原文档中的段落转化为字符串列表以准备检查
+            if batch is None:
+                batch = ParagraphBatch(original_doc_root)
+            # 相同文本的段落只预测一次，再回填到每个段落
+            unique_texts, inverse = batch.unique_texts()
+            if len(batch) > 0:
+                logger.info(f"目录识别段落数：{len(batch)}，去重后：{len(unique_texts)}，"
+                            f"重复率：{1 - len(unique_texts) / len(batch):.2%}")
+            if incremental is None:
+                check_result = self.classify_texts(unique_texts)[inverse]
+            else:
+                check_result = incremental.classify(self.model_hash, unique_texts, self.classify_texts)[inverse]
+                logger.info(f"目录识别增量预测，使用上次结果：{incremental.reused}，重新预测：{incremental.classified}")
+            target_doc_root = batch.build_result(check_result)
         except Exception as e:
             logger.exception(e)
             return None, f"目录识别出现异常: {str(e)}"
@@ -1,14 +1,15 @@
-import joblib
+import threading
 import numpy as np
 
-from api.model import DocRoot, DocumentGroup, Document
+from api.model import DocRoot, ParagraphBatch, IncrementalLabels
 from loguru import logger
 from numpy import ndarray
 from api.services.ServiceBase import ServiceBase
+from api.services.InferenceBackend import InferenceBackend
 from typing import Optional, Tuple
 import os
-from api.utility import TextUtils
-import scipy.sparse as sp
+from api.utility import FeatureUtils, PredictionCache, CascadeClassifier, TechStandardPreFilter, ModelArtifact
+from api.app_const import InvalidContentType, TECH_STANDARD_CASCADE_THRESHOLD
 
 
 class TechStandardIdentifyService(ServiceBase):
@@ -17,17 +18,23 @@ class TechStandardIdentifyService(ServiceBase):
     """
     _instance = None
     _is_initialized = False
+    _lock = threading.Lock()  # 防止并发的首次请求重复加载模型
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(TechStandardIdentifyService, cls).__new__(cls)
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(TechStandardIdentifyService, cls).__new__(cls)
         return cls._instance
 
     def __init__(self):
         logger.info("实例化TechStandardIdentifyService")
         if not self._is_initialized:
-            self._load_model()
-            TechStandardIdentifyService._is_initialized = True
+            with self._lock:
+                if not self._is_initialized:
+                    self.prefilter = TechStandardPreFilter()
+                    self._load_model()
+                    TechStandardIdentifyService._is_initialized = True
 
     def _load_model(self) -> None:
         """
@@ -39,11 +46,31 @@ class TechStandardIdentifyService(ServiceBase):
             # 加载模型
             logger.info(f"当前目录： {os.getcwd()}")
             prefix = "../" if os.getcwd().endswith("api") else ""
-            self.model = joblib.load(prefix + 'training/saved_models/tech_standard_model.joblib')
+            model_path = prefix + 'training/saved_models/tech_standard_model.joblib'
+            vectorizer_path = prefix + 'training/saved_models/tech_standard_vectorizer.joblib'
+            feature_index_path = prefix + 'training/saved_models/tech_standard_features.npy'
+            # 存在可内存映射版本时以mmap方式加载，多个进程共享同一份page cache
+            self.model = ModelArtifact.load(model_path)
             # 加载vectorizer
-            self.vectorizer = joblib.load(prefix + 'training/saved_models/tech_standard_vectorizer.joblib')
-
-            self.feature_indices = np.load(prefix + 'training/saved_models/tech_standard_features.npy')
+            self.vectorizer = ModelArtifact.load(vectorizer_path)
+
+            self.feature_indices = ModelArtifact.load(feature_index_path)
+            model_files = [ModelArtifact.resolve(model_path), ModelArtifact.resolve(vectorizer_path),
+                           ModelArtifact.resolve(feature_index_path)]
+
+            # 级联的第一级模型（可选）：置信度高的段落不再经过集成模型
+            self.cascade = None
+            cascade_model_path = prefix + 'training/saved_models/tech_standard_cascade_model.joblib'
+            if TECH_STANDARD_CASCADE_THRESHOLD > 0 and os.path.exists(cascade_model_path):
+                self.cascade = CascadeClassifier(ModelArtifact.load(cascade_model_path), self.model,
+                                                 TECH_STANDARD_CASCADE_THRESHOLD)
+                model_files.append(ModelArtifact.resolve(cascade_model_path))
+                logger.info(f"启用级联预测，阈值：{TECH_STANDARD_CASCADE_THRESHOLD}")
+
+            # 模型文件哈希（用于预测结果缓存，模型更新后旧的缓存自动失效）
+            self.model_hash = PredictionCache.hash_files(model_files)
+            if self.cascade is not None:
+                self.model_hash += f":{TECH_STANDARD_CASCADE_THRESHOLD}"
             logger.info("加载模型与分词成功")
         except Exception as e:
             logger.error("加载模型出错")
@@ -65,48 +92,83 @@ class TechStandardIdentifyService(ServiceBase):
         content_vectored = self.vectorizer.transform(content)
         return self.model.predict(content_vectored)
 
-    def identify(self, original_doc_root: DocRoot) -> Tuple[Optional[DocRoot], Optional[str]]:
+    def predict_texts(self, texts: list[str]) -> ndarray:
+        """
+        对一批段落文本进行预测（一次向量化、提取特征与预测）
+        :param texts: 段落文本（已去掉前后空白字符）
+        :return: 与texts一一对应的预测结果
+        """
+        if not texts:
+            return np.zeros(0, dtype=int)
+
+        # 文本转为向量并添加自定义特征，在稀疏矩阵上直接进行特征选择
+        para_vectors = FeatureUtils.build_tech_standard_features(self.vectorizer, texts, self.feature_indices)
+
+        # 使用模型预测（启用级联时先由第一级模型预测）
+        if self.cascade is not None:
+            return self.cascade.predict(para_vectors)
+        return self.model.predict(para_vectors)
+
+    def predict_with_backend(self, texts: list[str]) -> ndarray:
+        """
+        经推理后端预测（thread后端在当前线程中预测，process后端分批交给进程池）
+        :param texts: 段落文本
+        :return: 与texts一一对应的预测结果
+        """
+        return InferenceBackend.get_instance().predict(InvalidContentType.TECH_STANDARD.value, texts, self.predict_texts)
+
+    def classify_texts(self, texts: list[str]) -> ndarray:
+        """
+        对一批段落文本进行预测（先经过规则预筛选，再优先使用预测结果缓存）
+        :param texts: 段落文本（已去掉前后空白字符）
+        :return: 与texts一一对应的预测结果
+        """
+        # 规则预筛选：明显的段落直接得到结果，不需要分词与模型预测
+        labels = self.prefilter.apply(texts)
+        undecided = np.flatnonzero(labels == TechStandardPreFilter.UNDECIDED)
+        if len(undecided) == 0:
+            return labels
+
+        undecided_texts = [texts[index] for index in undecided]
+        cache = PredictionCache.get_instance()
+        if cache is None:
+            labels[undecided] = self.predict_with_backend(undecided_texts)
+        else:
+            labels[undecided] = cache.classify(InvalidContentType.TECH_STANDARD.value, self.model_hash,
+                                               undecided_texts, self.predict_with_backend)
+        return labels
+
+    def identify(self, original_doc_root: DocRoot,
+                 batch: Optional[ParagraphBatch] = None,
+                 incremental: Optional[IncrementalLabels] = None) -> Tuple[Optional[DocRoot], Optional[str]]:
         """
-        技术标准识别
+        技术标准识别（整个DocRoot的段落合并为一批进行预测，再按偏移量回填到各文档）
         :param original_doc_root:
+        :param batch: 已从original_doc_root收集的段落批次（多个检查项共用），为None时重新收集
+        :param incremental: 增量预测（只预测上次检查中没有出现过的段落文本），为None时全部预测
         :return:
         """
-        target_doc_root = DocRoot(document_groups={})  # 检查结果
         try:
-            for group_key, group_data in original_doc_root.document_groups.items():
-                # 方案组
-                target_doc_group_data = DocumentGroup(documents={})
-                for doc_key, doc_data in group_data.documents.items():
-                    # 文档
-                    target_doc_data = Document(paragraphs=[])
-                    # 将原文档中的段落转化为字符串列表以准备检查
-                    doc_paragraphs: list[str] = [para.text.strip() for para in doc_data.paragraphs if para.text.strip()]
-                    # 文本转为向量
-                    para_vectors = self.vectorizer.transform(doc_paragraphs)
-
-                    # 添加自定义特征
-                    custom_features = [TextUtils.extract_tech_standard_features(para) for para in doc_paragraphs]
-                    para_vectors = sp.hstack((para_vectors, custom_features))
-
-                    # 使用特征选择
-                    para_vectors = para_vectors.toarray()[:, self.feature_indices]
-
-                    # 使用模型预测
-                    doc_check_result = self.model.predict(para_vectors)
-
-                    # 进一步判断（提高召回率与精确率）
-                    # for i, text in enumerate(doc_paragraphs):
-                    #     if TextUtils.fit_tech_standard_pattern(text):
-                    #         doc_check_result[i] = 1
-
-                    for index, value in enumerate(doc_check_result):
-                        if value == 1:
-                            # 往结果对象中添加原文档中的段落
-                            target_doc_data.paragraphs.append(doc_data.paragraphs[index])
-                    # 当前文档已检查完，向方案组中添加当前文档的检查结果
-                    target_doc_group_data.documents[doc_key] = target_doc_data
-                # 添加方案组
-                target_doc_root.document_groups[group_key] = target_doc_group_data
+            # 将原文档中的段落转化为字符串列表以准备检查（去掉空段落）
+            batch = ParagraphBatch(original_doc_root, strip=True) if batch is None else batch.stripped()
+            # 相同文本的段落只预测一次，再回填到每个段落
+            unique_texts, inverse = batch.unique_texts()
+            if len(batch) > 0:
+                logger.info(f"技术标准识别段落数：{len(batch)}，去重后：{len(unique_texts)}，"
+                            f"重复率：{1 - len(unique_texts) / len(batch):.2%}")
+            if incremental is None:
+                check_result = self.classify_texts(unique_texts)[inverse]
+            else:
+                check_result = incremental.classify(self.model_hash, unique_texts, self.classify_texts)[inverse]
+                logger.info(f"技术标准识别增量预测，使用上次结果：{incremental.reused}，重新预测：{incremental.classified}")
+            logger.info(f"规则预筛选命中统计：{self.prefilter.stats()}")
+
+            # 进一步判断（提高召回率与精确率）
+            # for i, text in enumerate(batch.texts):
+            #     if TextUtils.fit_tech_standard_pattern(text):
+            #         check_result[i] = 1
+
+            target_doc_root = batch.build_result(check_result)
         except Exception as e:
             logger.exception(e)
             return None, f"技术标准识别出现异常: {str(e)}"
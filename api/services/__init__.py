@@ -2,3 +2,7 @@ from .InfoExtractionService import InfoExtractionService
 from .InvalidContentIdentifyService import InvalidContentIdentifyService
 from .TechStandardIdentifyService import TechStandardIdentifyService
 from .TOCIdentifyService import TOCIdentifyService
+from .MicroBatchScheduler import MicroBatchScheduler
+from .InferenceBackend import InferenceBackend
+from .ModelRegistry import ModelRegistry
+from .CallbackDispatcher import CallbackDispatcher
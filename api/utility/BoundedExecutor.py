@@ -0,0 +1,146 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from loguru import logger
+from api.utility.Metrics import Metrics
+
+# 拒绝原因：等待队列已满 / 客户端的未完成任务数已达上限
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_CLIENT_LIMIT = "client_limit"
+
+
+class BoundedExecutor:
+    """
+    有界的线程池：执行中与排队中的任务总数不超过 线程数 + 队列长度，每个客户端的未完成任务数不超过其上限；
+    超出时立即拒绝（由调用方返回503/429与Retry-After），而不是无限排队
+    使用方式：先reserve占用名额，成功后再submit；多个任务合并为一个执行（如批量提交）时按任务数占用名额
+    """
+
+    # 任务平均耗时的平滑系数（指数移动平均）
+    DURATION_SMOOTHING = 0.2
+
+    def __init__(self, max_workers: int, max_queue: int, client_limits: Dict[str, int],
+                 default_client_limit: int = 0, default_retry_after: int = 30, max_retry_after: int = 300):
+        """
+        :param max_workers: 线程数
+        :param max_queue: 排队任务的最大数量
+        :param client_limits: 各客户端的未完成任务数上限
+        :param default_client_limit: 未单独设置的客户端的上限（0表示不限制）
+        :param default_retry_after: 还没有任务耗时数据时建议的重试等待时间（秒）
+        :param max_retry_after: 建议的重试等待时间的上限（秒）
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.client_limits = client_limits
+        self.default_client_limit = default_client_limit
+        self.default_retry_after = default_retry_after
+        self.max_retry_after = max_retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._pending = 0  # 执行中与排队中的任务数
+        self._running = 0
+        self._client_pending: Dict[str, int] = {}
+        self._average_duration: Optional[float] = None
+
+    @property
+    def capacity(self) -> int:
+        """
+        执行中与排队中的任务总数的上限（一次占用的名额数超过该值时总是被拒绝）
+        :return:
+        """
+        return self.max_workers + self.max_queue
+
+    def reserve(self, client_id: str, force: bool = False, count: int = 1) -> Optional[str]:
+        """
+        占用名额
+        :param client_id: 客户端ID
+        :param force: 不检查上限（如重新执行已接受的任务）
+        :param count: 占用的名额数（合并执行的任务数）
+        :return: 拒绝原因（REJECT_QUEUE_FULL或REJECT_CLIENT_LIMIT），成功时返回None
+        """
+        with self._lock:
+            if not force:
+                if self._pending + count > self.capacity:
+                    Metrics.increment("executor_rejected_queue_full")
+                    return REJECT_QUEUE_FULL
+                limit = self.client_limits.get(client_id, self.default_client_limit)
+                if 0 < limit < self._client_pending.get(client_id, 0) + count:
+                    Metrics.increment("executor_rejected_client_limit")
+                    return REJECT_CLIENT_LIMIT
+            self._pending += count
+            self._client_pending[client_id] = self._client_pending.get(client_id, 0) + count
+        return None
+
+    def release(self, client_id: str, count: int = 1) -> None:
+        """
+        释放通过reserve占用但没有提交任务的名额
+        :param client_id:
+        :param count: 占用时的名额数
+        :return:
+        """
+        with self._lock:
+            self._release(client_id, count)
+
+    def _release(self, client_id: str, count: int) -> None:
+        self._pending -= count
+        self._client_pending[client_id] -= count
+        if self._client_pending[client_id] == 0:
+            del self._client_pending[client_id]
+
+    def submit(self, client_id: str, fn: Callable, *args, count: int = 1) -> None:
+        """
+        提交任务（需要先通过reserve占用名额）
+        :param client_id: 客户端ID
+        :param fn:
+        :param args:
+        :param count: 占用时的名额数（执行结束后释放）
+        :return:
+        """
+        self._executor.submit(self._run, client_id, count, time.perf_counter(), fn, args)
+
+    def _run(self, client_id: str, count: int, submitted_at: float, fn: Callable, args: tuple) -> None:
+        start_time = time.perf_counter()
+        Metrics.observe("executor_queue_wait", start_time - submitted_at)
+        with self._lock:
+            self._running += count
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            duration = time.perf_counter() - start_time
+            Metrics.observe("executor_task", duration)
+            # 合并执行的任务按名额数平均，记录每个任务的平均耗时
+            duration /= count
+            with self._lock:
+                self._running -= count
+                self._release(client_id, count)
+                if self._average_duration is None:
+                    self._average_duration = duration
+                else:
+                    self._average_duration += self.DURATION_SMOOTHING * (duration - self._average_duration)
+
+    def retry_after(self) -> int:
+        """
+        建议客户端的重试等待时间：按任务平均耗时估算排队中的任务（按名额数计）全部开始执行所需的时间
+        :return: 秒
+        """
+        with self._lock:
+            if self._average_duration is None:
+                return self.default_retry_after
+            queued = max(self._pending - self._running, 0)
+            seconds = self._average_duration * (queued + 1) / self.max_workers
+        return min(max(math.ceil(seconds), 1), self.max_retry_after)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        当前的执行与排队情况
+        :return:
+        """
+        with self._lock:
+            return {"running": self._running,
+                    "queued": self._pending - self._running,
+                    "capacity": self.capacity,
+                    "clients": len(self._client_pending)}
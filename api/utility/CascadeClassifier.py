@@ -0,0 +1,56 @@
+import threading
+import numpy as np
+
+
+class CascadeClassifier:
+    """
+    两级级联分类：先用轻量的第一级模型预测，置信度达到阈值的段落直接采用其结果，
+    其余段落再交给完整的集成模型
+    """
+
+    def __init__(self, first_stage_model, model, threshold: float):
+        """
+        :param first_stage_model: 第一级（轻量）模型，需支持predict_proba
+        :param model: 完整的集成模型
+        :param threshold: 第一级模型的置信度阈值（最大类别概率）
+        """
+        self.first_stage_model = first_stage_model
+        self.model = model
+        self.threshold = threshold
+        self.first_stage_count = 0  # 由第一级模型决定的段落数
+        self.full_model_count = 0  # 交给完整模型的段落数
+        self._lock = threading.Lock()
+
+    def predict(self, x) -> np.ndarray:
+        """
+        级联预测
+        :param x: 特征矩阵
+        :return: 预测结果
+        """
+        if x.shape[0] == 0:
+            return np.zeros(0, dtype=int)
+
+        probabilities = self.first_stage_model.predict_proba(x)
+        labels = self.first_stage_model.classes_[probabilities.argmax(axis=1)]
+        uncertain = np.flatnonzero(probabilities.max(axis=1) < self.threshold)
+        if len(uncertain) > 0:
+            labels[uncertain] = self.model.predict(x[uncertain])
+
+        with self._lock:
+            self.first_stage_count += x.shape[0] - len(uncertain)
+            self.full_model_count += len(uncertain)
+        return labels
+
+    def stats(self) -> dict:
+        """
+        级联统计信息
+        :return:
+        """
+        with self._lock:
+            total = self.first_stage_count + self.full_model_count
+            return {
+                "threshold": self.threshold,
+                "first_stage": self.first_stage_count,
+                "full_model": self.full_model_count,
+                "first_stage_ratio": self.first_stage_count / total if total else 0.0
+            }
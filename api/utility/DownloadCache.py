@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, Iterable, Iterator
+import requests
+from loguru import logger
+from api.app_const import DOWNLOAD_CACHE_ENABLED, DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES, HTTP_CHUNK_SIZE
+
+# 下载内容文件与解析结果文件的扩展名
+BODY_SUFFIX = ".body"
+PARSED_SUFFIX = ".parsed"
+
+
+class DownloadCacheWriter:
+    """
+    边下载边写入缓存的临时文件，下载并解析成功后提交
+    """
+
+    def __init__(self, cache: 'DownloadCache', path: str, meta: Dict[str, Any]):
+        self.cache = cache
+        self.path = path
+        self.meta = meta
+        self.temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self.temp_path, "wb")
+        self._file.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._committed = False
+
+    def tee(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        把字节块写入临时文件，同时原样交给调用方
+        :param chunks:
+        :return:
+        """
+        for chunk in chunks:
+            self._file.write(chunk)
+            yield chunk
+
+    def commit(self) -> Dict[str, Any]:
+        """
+        提交缓存（临时文件改名为缓存文件）
+        :return: 缓存信息
+        """
+        self._file.close()
+        os.replace(self.temp_path, self.path)
+        self._committed = True
+        self.cache.evict()
+        return self.meta
+
+    def discard(self) -> None:
+        """
+        放弃缓存（未提交时删除临时文件）
+        :return:
+        """
+        if self._committed:
+            return
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class DownloadCache:
+    """
+    标书文件下载缓存（本地磁盘，按URL缓存，总大小有上限，超出时删除最久未使用的文件）：
+    再次下载同一URL时使用ETag/Last-Modified进行条件请求，服务器返回304时直接使用缓存的内容；
+    还可以缓存解析后的DocRoot（pickle），同一份标书再次检查时既不用下载也不用解析
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str = DOWNLOAD_CACHE_DIR, max_bytes: int = DOWNLOAD_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls) -> Optional['DownloadCache']:
+        """
+        获取进程内共享的缓存实例（未启用缓存或初始化失败时返回None）
+        :return:
+        """
+        if not DOWNLOAD_CACHE_ENABLED:
+            return None
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    try:
+                        cls._instance = cls()
+                    except Exception as e:
+                        logger.error(f"初始化下载缓存失败：{str(e)}")
+                        return None
+        return cls._instance
+
+    def _path(self, url: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + suffix)
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        查找URL的缓存（第一行为缓存信息，之后为下载的内容）
+        :param url:
+        :return: 缓存信息（url、etag、last_modified、path），没有缓存时返回None
+        """
+        path = self._path(url, BODY_SUFFIX)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+            os.utime(path)  # 记录最近使用时间
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        meta["path"] = path
+        return meta
+
+    @staticmethod
+    def conditional_headers(meta: Dict[str, Any]) -> Dict[str, str]:
+        """
+        条件请求的请求头
+        :param meta: 缓存信息
+        :return:
+        """
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    @staticmethod
+    def iter_body(meta: Dict[str, Any]) -> Iterator[bytes]:
+        """
+        分块读取缓存的内容
+        :param meta: 缓存信息
+        :return:
+        """
+        with open(meta["path"], "rb") as f:
+            f.readline()
+            for chunk in iter(lambda: f.read(HTTP_CHUNK_SIZE), b""):
+                yield chunk
+
+    def open_writer(self, url: str, response: requests.Response) -> Optional[DownloadCacheWriter]:
+        """
+        为下载的响应创建缓存写入器（响应中没有ETag与Last-Modified时无法验证缓存是否有效，不缓存）
+        :param url:
+        :param response:
+        :return:
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "stored_at": time.time()}
+        try:
+            return DownloadCacheWriter(self, self._path(url, BODY_SUFFIX), meta)
+        except OSError as e:
+            logger.error(f"创建下载缓存文件失败：{str(e)}")
+            return None
+
+    def load_parsed(self, meta: Dict[str, Any], include_group_id: bool) -> Optional[Any]:
+        """
+        读取缓存的解析结果（与下载内容的ETag/Last-Modified一致时才有效）
+        :param meta: 缓存信息
+        :param include_group_id: 解析时数据中是否包含GroupId这一层
+        :return: DocRoot，没有有效的缓存时返回None
+        """
+        path = self._path(meta["url"], f".{int(include_group_id)}{PARSED_SUFFIX}")
+        try:
+            with open(path, "rb") as f:
+                parsed = pickle.load(f)
+            os.utime(path)
+        except OSError:
+            return None
+        except Exception as e:
+            # 文件不完整或已损坏（pickle可能抛出各种异常），删除后改用缓存的文件内容
+            logger.warning(f"读取缓存的解析结果失败，已删除：{str(e)}")
+            self._remove_file(path)
+            return None
+        if not isinstance(parsed, dict):
+            self._remove_file(path)
+            return None
+        if parsed.get("etag") != meta.get("etag") or parsed.get("last_modified") != meta.get("last_modified"):
+            return None
+        return parsed["doc_root"]
+
+    def store_parsed(self, meta: Dict[str, Any], include_group_id: bool, doc_root: Any) -> None:
+        """
+        缓存解析结果
+        :param meta: 缓存信息
+        :param include_group_id: 解析时数据中是否包含GroupId这一层
+        :param doc_root: DocRoot
+        :return:
+        """
+        path = self._path(meta["url"], f".{int(include_group_id)}{PARSED_SUFFIX}")
+        temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                pickle.dump({"etag": meta.get("etag"), "last_modified": meta.get("last_modified"),
+                             "doc_root": doc_root}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"缓存解析结果失败：{str(e)}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        self.evict()
+
+    def remove(self, meta: Dict[str, Any]) -> None:
+        """
+        删除URL的缓存（下载内容与解析结果）
+        :param meta: 缓存信息
+        :return:
+        """
+        self._remove_file(meta["path"])
+        for include_group_id in (True, False):
+            self._remove_file(self._path(meta["url"], f".{int(include_group_id)}{PARSED_SUFFIX}"))
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """
+        缓存总大小超出上限时，按最近使用时间从旧到新删除文件
+        :return:
+        """
+        with self._evict_lock:
+            entries = []
+            total = 0
+            stale_before = time.time() - 3600
+            for entry in os.scandir(self.cache_dir):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(".tmp"):
+                        # 进程在写入时退出而遗留的临时文件
+                        if stat.st_mtime < stale_before:
+                            os.remove(entry.path)
+                        continue
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+                if total <= self.max_bytes:
+                    break
@@ -0,0 +1,33 @@
+from api.utility.TextUtils import TextUtils
+
+
+class FeatureUtils:
+    """
+    特征矩阵相关方法（全程使用稀疏矩阵，避免生成 段落数×词表大小 的稠密矩阵）
+    """
+
+    @staticmethod
+    def select_columns(matrix, feature_indices):
+        """
+        直接在稀疏矩阵上选择特征列
+        :param matrix: 稀疏特征矩阵
+        :param feature_indices: 要保留的列索引
+        :return: CSR矩阵
+        """
+        import scipy.sparse as sp
+        return sp.csr_matrix(matrix)[:, feature_indices]
+
+    @staticmethod
+    def build_tech_standard_features(vectorizer, texts: list[str], feature_indices):
+        """
+        构建技术标准模型的输入特征：TF-IDF向量 + 自定义特征，再进行特征选择
+        :param vectorizer: TF-IDF vectorizer
+        :param texts: 段落文本
+        :param feature_indices: 特征选择后保留的列索引
+        :return:
+        """
+        import scipy.sparse as sp
+        para_vectors = vectorizer.transform(texts)
+        custom_features = sp.csr_matrix(TextUtils.extract_tech_standard_features_batch(texts))
+        para_vectors = sp.hstack((para_vectors, custom_features), format="csr")
+        return FeatureUtils.select_columns(para_vectors, feature_indices)
@@ -1,11 +1,84 @@
+import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional, Tuple
+from api.app_const import HTTP_CHUNK_SIZE, HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_CONNECT_TIMEOUT, \
+    HTTP_DOWNLOAD_TIMEOUT, HTTP_CALLBACK_TIMEOUT, HTTP_RETRIES, HTTP_RETRY_BACKOFF, HTTP_RETRY_STATUS
+from api.utility.Metrics import Metrics
 
 
 class HttpUtils:
     """
-    Http请求相关方法
+    Http请求相关方法：所有请求共用连接池（按主机保持长连接），设置连接/读取超时；
+    GET请求的连接失败与网关类错误按指数退避重试有限次数，POST（回调）只重试连接失败（请求未发出），
+    其余失败由回调分发器按自己的退避策略重试，避免两层重试叠加
     """
+    _session: Optional[requests.Session] = None
+    _post_session: Optional[requests.Session] = None
+    _session_pid: Optional[int] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _create_session(retry: Retry) -> requests.Session:
+        """
+        创建Session
+        :param retry: 重试策略
+        :return:
+        """
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                              pool_maxsize=HTTP_POOL_MAXSIZE,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @classmethod
+    def _ensure_sessions(cls) -> None:
+        """
+        创建当前进程共用的Session（gunicorn fork之后在各worker中重新创建，不共用父进程的连接）
+        :return:
+        """
+        pid = os.getpid()
+        if cls._session is None or cls._session_pid != pid:
+            with cls._lock:
+                if cls._session is None or cls._session_pid != pid:
+                    cls._session = cls._create_session(Retry(total=HTTP_RETRIES,
+                                                             backoff_factor=HTTP_RETRY_BACKOFF,
+                                                             status_forcelist=HTTP_RETRY_STATUS,
+                                                             allowed_methods=frozenset({"GET"}),
+                                                             raise_on_status=False))
+                    # 连接失败时请求尚未发出，可以安全重试；读取超时与错误状态码不重试（交给回调分发器）
+                    cls._post_session = cls._create_session(Retry(total=HTTP_RETRIES,
+                                                                  connect=HTTP_RETRIES,
+                                                                  read=0,
+                                                                  status=0,
+                                                                  other=0,
+                                                                  backoff_factor=HTTP_RETRY_BACKOFF,
+                                                                  allowed_methods=frozenset({"POST"}),
+                                                                  raise_on_status=False))
+                    cls._session_pid = pid
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """
+        当前进程共用的GET请求Session
+        :return:
+        """
+        cls._ensure_sessions()
+        return cls._session
+
+    @classmethod
+    def get_post_session(cls) -> requests.Session:
+        """
+        当前进程共用的POST请求Session（只重试连接失败）
+        :return:
+        """
+        cls._ensure_sessions()
+        return cls._post_session
 
     @staticmethod
     def get_json_from_url(url) -> Tuple[Optional[str], Optional[str]]:
@@ -15,7 +88,8 @@ class HttpUtils:
         """
         try:
             # 发送GET请求到指定的URL
-            response = requests.get(url)
+            with Metrics.timer("http_download"):
+                response = HttpUtils.get_session().get(url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_DOWNLOAD_TIMEOUT))
 
             # 检查请求是否成功
             if response.status_code == 200:
@@ -23,6 +97,62 @@ class HttpUtils:
                 json_data = response.content.decode(encoding="utf-8")
                 return json_data, None
             else:
+                Metrics.increment("http_download_errors")
                 return None, f"请求失败。状态码: {response.status_code}"
         except requests.RequestException as e:
+            Metrics.increment("http_download_errors")
             return None, f"请求出错: {str(e)}"
+
+    @staticmethod
+    def get_stream_from_url(url, headers: Optional[dict] = None) -> Tuple[Optional[requests.Response], Optional[str]]:
+        """
+        以流式方式请求指定URL，响应内容由调用方通过iter_chunks分块读取（读取结束后需关闭响应）
+        :param url:
+        :param headers: 请求头（带有条件请求头时，304也视为请求成功）
+        :return: 响应，错误消息；如请求成功，响应不空，错误消息为空，反之则相反
+        """
+        try:
+            # 流式请求只统计到收到响应头为止的耗时
+            with Metrics.timer("http_download"):
+                response = HttpUtils.get_session().get(url, stream=True, headers=headers,
+                                                       timeout=(HTTP_CONNECT_TIMEOUT, HTTP_DOWNLOAD_TIMEOUT))
+            if response.status_code == 200 or (response.status_code == 304 and headers):
+                return response, None
+            else:
+                response.close()
+                Metrics.increment("http_download_errors")
+                return None, f"请求失败。状态码: {response.status_code}"
+        except requests.RequestException as e:
+            Metrics.increment("http_download_errors")
+            return None, f"请求出错: {str(e)}"
+
+    @staticmethod
+    def iter_chunks(response: requests.Response):
+        """
+        分块读取响应内容
+        :param response:
+        :return:
+        """
+        return response.iter_content(chunk_size=HTTP_CHUNK_SIZE)
+
+    @staticmethod
+    def post_json(url: str, data: bytes) -> requests.Response:
+        """
+        发送JSON请求（用于回调），请求失败时抛出requests.RequestException
+        :param url:
+        :param data: 已编码的JSON
+        :return:
+        """
+        start_time = time.perf_counter()
+        try:
+            response = HttpUtils.get_post_session().post(url, data=data,
+                                                         headers={"Content-Type": "application/json"},
+                                                         timeout=(HTTP_CONNECT_TIMEOUT, HTTP_CALLBACK_TIMEOUT))
+        except requests.RequestException:
+            Metrics.increment("http_callback_errors")
+            raise
+        finally:
+            Metrics.observe("http_callback", time.perf_counter() - start_time)
+        if response.status_code >= 400:
+            Metrics.increment("http_callback_errors")
+        return response
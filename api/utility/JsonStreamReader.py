@@ -0,0 +1,177 @@
+import codecs
+import json
+from json.decoder import scanstring
+from typing import Iterable, Iterator, Any
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]}"
+
+
+class JsonStreamReader:
+    """
+    增量JSON读取：从字节块迭代器中边读取边解析，只在缓冲区中保留尚未解析的部分；
+    由调用方按结构逐层遍历对象与数组，叶子值（如单个段落）再整体解析
+    """
+
+    def __init__(self, chunks: Iterable[bytes], encoding: str = "utf-8"):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._discarded = 0  # 已从缓冲区中丢弃的字符数（用于错误消息中的位置）
+        self._eof = False
+
+    def _fill(self, min_size: int = 1) -> bool:
+        """
+        从字节块迭代器中读取更多内容到缓冲区
+        :param min_size: 至少读取的字符数
+        :return: 是否读取到了新内容或刚读到结尾（结尾时被截断的判断随之改变）
+        """
+        was_eof = self._eof
+        pieces = []
+        added = 0
+        while not self._eof and added < min_size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                text = self._decoder.decode(b"", final=True)
+                self._eof = True
+            else:
+                text = self._decoder.decode(chunk)
+            pieces.append(text)
+            added += len(text)
+        if added == 0:
+            return self._eof and not was_eof
+        # 新内容一次性拼接，同时丢弃已解析的部分：每次只复制尚未解析的部分，而调用方需要更多内容时
+        # 要求读取的字符数不少于尚未解析的部分，总的复制量与输入长度成线性关系
+        self._discarded += self._pos
+        pieces[0:0] = [self._buffer[self._pos:]]
+        self._buffer = "".join(pieces)
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        跳过空白字符，返回下一个字符（已到结尾时返回空字符串）
+        :return:
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"JSON格式错误：期望 '{char}'，实际为 '{found}'，位置 {self._discarded + self._pos}")
+        self._pos += 1
+
+    def _read_string(self) -> str:
+        self._expect('"')
+        while True:
+            try:
+                value, end = scanstring(self._buffer, self._pos)
+                self._pos = end
+                return value
+            except json.JSONDecodeError:
+                # 字符串被截断在缓冲区末尾，读取更多内容后重试
+                if not self._fill(len(self._buffer) - self._pos + 1):
+                    raise
+
+    def read_value(self) -> Any:
+        """
+        读取一个完整的JSON值（适用于较小的叶子值）
+        :return:
+        """
+        if self._peek() not in '{["':
+            # 数字、true等标量值没有结束符，可能被截断在缓冲区末尾（如 "2." 与 "2.5e3"），需要读到分隔符才能确认
+            offset = 0
+            while True:
+                while self._pos + offset < len(self._buffer) and self._buffer[self._pos + offset] not in _DELIMITERS:
+                    offset += 1
+                if self._pos + offset < len(self._buffer) or not self._fill(offset + 1):
+                    break
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+                # 容器中的值也可能恰好被截断在缓冲区末尾
+                if end == len(self._buffer) and not self._eof:
+                    raise json.JSONDecodeError("可能被截断", self._buffer, end)
+                self._pos = end
+                return value
+            except json.JSONDecodeError:
+                if not self._fill(len(self._buffer) - self._pos + 1):
+                    raise
+
+    def skip_value(self) -> None:
+        """
+        跳过一个JSON值
+        :return:
+        """
+        char = self._peek()
+        if char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        elif char == "[":
+            for _ in self.iter_array():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        遍历一个JSON对象：每次返回一个键，调用方需要在下一次迭代前读取（或跳过）该键对应的值
+        :return:
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._read_string()
+            self._expect(":")
+            yield key
+            char = self._peek()
+            self._pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"JSON格式错误：对象中期望 ',' 或 '}}'，实际为 '{char}'")
+
+    def iter_array(self) -> Iterator[int]:
+        """
+        遍历一个JSON数组：每次返回元素序号，调用方需要在下一次迭代前读取（或跳过）该元素
+        :return:
+        """
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            char = self._peek()
+            self._pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"JSON格式错误：数组中期望 ',' 或 ']'，实际为 '{char}'")
+
+    def peek(self) -> str:
+        """
+        下一个非空白字符（不移动位置）
+        :return:
+        """
+        return self._peek()
+
+    def ensure_end(self) -> None:
+        """
+        确认后面只剩空白字符
+        :return:
+        """
+        if self._peek() != "":
+            raise ValueError("JSON格式错误：结尾有多余内容")
@@ -0,0 +1,70 @@
+import json
+from typing import Any, List
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+
+
+class RawJson:
+    """
+    已编码好的JSON片段（UTF-8字节），由JsonUtils.dumps原样写入，不再解码与重新编码
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+class JsonUtils:
+    """
+    JSON编码相关方法：直接输出UTF-8字节（紧凑格式，不转义中文），优先使用orjson
+    """
+
+    @staticmethod
+    def encode(obj: Any) -> bytes:
+        """
+        编码为JSON字节
+        :param obj: 只包含基本类型的对象
+        :return:
+        """
+        if orjson is not None:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        """
+        编码为JSON字节，对象中可以包含RawJson片段（如检查结果），片段原样拼接
+        :param obj:
+        :return:
+        """
+        parts: List[bytes] = []
+        JsonUtils._write(obj, parts)
+        return b"".join(parts)
+
+    @staticmethod
+    def _write(obj: Any, parts: List[bytes]) -> None:
+        if isinstance(obj, RawJson):
+            parts.append(obj.data)
+        elif isinstance(obj, dict):
+            parts.append(b"{")
+            for index, (key, value) in enumerate(obj.items()):
+                if index > 0:
+                    parts.append(b",")
+                parts.append(JsonUtils.encode(key if isinstance(key, str) else str(key)))
+                parts.append(b":")
+                JsonUtils._write(value, parts)
+            parts.append(b"}")
+        elif isinstance(obj, (list, tuple)):
+            parts.append(b"[")
+            for index, value in enumerate(obj):
+                if index > 0:
+                    parts.append(b",")
+                JsonUtils._write(value, parts)
+            parts.append(b"]")
+        else:
+            parts.append(JsonUtils.encode(obj))
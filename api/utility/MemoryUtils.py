@@ -0,0 +1,31 @@
+import os
+import resource
+
+
+class MemoryUtils:
+    """
+    进程内存相关方法
+    """
+
+    @staticmethod
+    def get_memory_usage() -> dict:
+        """
+        当前进程的内存占用（MB）：rss 常驻内存，pss 按共享进程数分摊后的内存，shared 与其他进程共享的内存
+        （/proc不可用时只返回rss峰值）
+        :return:
+        """
+        try:
+            values = {}
+            with open("/proc/self/smaps_rollup", "r") as file:
+                for line in file:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0] in ("Rss:", "Pss:", "Shared_Clean:", "Shared_Dirty:"):
+                        values[parts[0][:-1]] = int(parts[1]) / 1024
+            return {
+                "pid": os.getpid(),
+                "rss": round(values.get("Rss", 0), 1),
+                "pss": round(values.get("Pss", 0), 1),
+                "shared": round(values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0), 1)
+            }
+        except OSError:
+            return {"pid": os.getpid(), "rss": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
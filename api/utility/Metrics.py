@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Callable, Any
+
+
+class Metrics:
+    """
+    进程内的运行指标：计数、当前值与耗时分布（使用gunicorn多个worker时，每个worker各自统计）
+    """
+    _lock = threading.Lock()
+    _counters: Dict[str, float] = {}
+    _gauges: Dict[str, Callable[[], Any]] = {}
+    _timings: Dict[str, Dict[str, Any]] = {}
+
+    # 耗时分布的区间上限（秒）
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    @classmethod
+    def increment(cls, name: str, value: float = 1) -> None:
+        """
+        计数增加
+        :param name: 指标名称
+        :param value: 增加的值
+        :return:
+        """
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + value
+
+    @classmethod
+    def register_gauge(cls, name: str, func: Callable[[], Any]) -> None:
+        """
+        注册当前值指标（输出指标时调用func取值，如队列长度）
+        :param name: 指标名称
+        :param func: 取值函数
+        :return:
+        """
+        with cls._lock:
+            cls._gauges[name] = func
+
+    @classmethod
+    def observe(cls, name: str, seconds: float) -> None:
+        """
+        记录一次耗时
+        :param name: 指标名称
+        :param seconds: 耗时（秒）
+        :return:
+        """
+        with cls._lock:
+            timing = cls._timings.get(name)
+            if timing is None:
+                timing = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(cls.LATENCY_BUCKETS) + 1)}
+                cls._timings[name] = timing
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            for index, bound in enumerate(cls.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    timing["buckets"][index] += 1
+                    break
+            else:
+                timing["buckets"][-1] += 1
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name: str):
+        """
+        记录with块的耗时
+        :param name: 指标名称
+        :return:
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(name, time.perf_counter() - start_time)
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Any]:
+        """
+        当前所有指标
+        :return:
+        """
+        with cls._lock:
+            counters = dict(cls._counters)
+            gauges = dict(cls._gauges)
+            timings = {}
+            for name, timing in cls._timings.items():
+                buckets = {f"le_{bound}": count for bound, count in zip(cls.LATENCY_BUCKETS, timing["buckets"])}
+                buckets["le_inf"] = timing["buckets"][-1]
+                timings[name] = {"count": timing["count"],
+                                 "avg": round(timing["sum"] / timing["count"], 4),
+                                 "max": round(timing["max"], 4),
+                                 "buckets": buckets}
+        return {"pid": os.getpid(),
+                "counters": counters,
+                "gauges": {name: func() for name, func in gauges.items()},
+                "timings": timings}
@@ -0,0 +1,88 @@
+import os
+import sys
+import numpy as np
+from loguru import logger
+
+
+class ModelArtifact:
+    """
+    模型文件的读写：除原有的joblib文件外，可导出一份不压缩的“可内存映射”版本（保存在同目录的mmap子目录下），
+    加载时优先使用该版本并以mmap_mode='r'打开，其中的大数组直接映射文件，
+    同一节点上的多个worker与推理进程共享同一份page cache，加载耗时也不随进程数增长
+    （注：RandomForest的决策树在反序列化时会被sklearn复制到进程私有内存，无法共享）
+    """
+
+    MMAP_DIR = "mmap"
+
+    @staticmethod
+    def mmap_path(path: str) -> str:
+        """
+        模型文件对应的可内存映射版本的路径
+        :param path: 原模型文件路径
+        :return:
+        """
+        return os.path.join(os.path.dirname(path), ModelArtifact.MMAP_DIR, os.path.basename(path))
+
+    @staticmethod
+    def resolve(path: str) -> str:
+        """
+        实际要加载的文件：存在可内存映射版本时使用该版本
+        :param path: 原模型文件路径
+        :return:
+        """
+        mmap_path = ModelArtifact.mmap_path(path)
+        return mmap_path if os.path.exists(mmap_path) else path
+
+    @staticmethod
+    def load(path: str):
+        """
+        加载模型文件（优先以内存映射方式加载可内存映射版本）
+        :param path: 原模型文件路径
+        :return:
+        """
+        import joblib
+        resolved = ModelArtifact.resolve(path)
+        mmap_mode = "r" if resolved != path else None
+        if resolved.endswith(".npy"):
+            return np.load(resolved, mmap_mode=mmap_mode)
+        return joblib.load(resolved, mmap_mode=mmap_mode)
+
+    @staticmethod
+    def export(obj, path: str) -> str:
+        """
+        导出可内存映射版本（不压缩，数组按原始字节保存）
+        :param obj: 模型、vectorizer或特征索引
+        :param path: 原模型文件路径
+        :return: 导出的文件路径
+        """
+        import joblib
+        mmap_path = ModelArtifact.mmap_path(path)
+        os.makedirs(os.path.dirname(mmap_path), exist_ok=True)
+        if isinstance(obj, np.ndarray):
+            np.save(mmap_path, np.ascontiguousarray(obj))
+        else:
+            joblib.dump(obj, mmap_path, compress=0)
+        return mmap_path
+
+    @staticmethod
+    def export_directory(directory: str) -> None:
+        """
+        把目录下已有的模型文件全部导出为可内存映射版本（用于镜像构建时转换，不需要重新训练）
+        :param directory: 模型目录
+        :return:
+        """
+        import joblib
+        for file_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file_name)
+            if file_name.endswith(".joblib"):
+                obj = joblib.load(path)
+            elif file_name.endswith(".npy"):
+                obj = np.load(path)
+            else:
+                continue
+            logger.info(f"导出可内存映射的模型文件：{ModelArtifact.export(obj, path)}")
+
+
+if __name__ == "__main__":
+    # python -m api.utility.ModelArtifact training/saved_models
+    ModelArtifact.export_directory(sys.argv[1] if len(sys.argv) > 1 else "training/saved_models")
@@ -0,0 +1,261 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import numpy as np
+from loguru import logger
+from api.app_const import PREDICTION_CACHE_ENABLED, PREDICTION_CACHE_PATH, PREDICTION_CACHE_MEMORY_ENTRIES, \
+    PREDICTION_CACHE_MAX_ROWS
+
+
+class PredictionCache:
+    """
+    段落预测结果缓存，键为（段落文本哈希, 检查类型, 模型文件哈希）；
+    文本哈希对传给模型的原文计算，不做NFKC、空白合并等规范化（这些变换会改变分词与正则特征，规范化后相同的段落
+    模型的预测结果可能不同）
+    分两级：进程内LRU缓存 + 本地SQLite文件（同一节点的所有worker共享，重启后仍然有效）
+    模型文件变化后哈希随之变化，旧模型的缓存条目会被自动清理
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    # 每写入多少条检查一次磁盘缓存的大小
+    EVICT_CHECK_INTERVAL = 1000
+
+    def __init__(self, db_path: str = PREDICTION_CACHE_PATH,
+                 memory_entries: int = PREDICTION_CACHE_MEMORY_ENTRIES,
+                 max_rows: int = PREDICTION_CACHE_MAX_ROWS):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.max_rows = max_rows
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[tuple, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_check = 0
+        self._purged_models: set[tuple] = set()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS predictions ("
+                         "text_hash TEXT NOT NULL, check_type TEXT NOT NULL, model_hash TEXT NOT NULL, "
+                         "label INTEGER NOT NULL, last_access REAL NOT NULL, "
+                         "PRIMARY KEY (text_hash, check_type, model_hash))")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_last_access ON predictions (last_access)")
+
+    @classmethod
+    def get_instance(cls) -> Optional['PredictionCache']:
+        """
+        获取进程内共享的缓存实例（未启用缓存或初始化失败时返回None）
+        :return:
+        """
+        if not PREDICTION_CACHE_ENABLED:
+            return None
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    try:
+                        cls._instance = cls()
+                    except Exception as e:
+                        logger.error(f"初始化预测结果缓存失败：{str(e)}")
+                        return None
+        return cls._instance
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """
+        段落文本的哈希（对传给模型的文本计算）
+        :param text:
+        :return:
+        """
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def hash_files(paths: list[str]) -> str:
+        """
+        模型文件的哈希（模型、vectorizer等文件一起计算）
+        :param paths: 文件路径
+        :return:
+        """
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        每个线程使用独立的SQLite连接
+        :return:
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _purge_old_models(self, check_type: str, model_hash: str) -> None:
+        """
+        删除同一检查类型下旧模型的缓存条目
+        :param check_type:
+        :param model_hash:
+        :return:
+        """
+        with self._lock:
+            if (check_type, model_hash) in self._purged_models:
+                return
+        with self._connection() as conn:
+            deleted = conn.execute("DELETE FROM predictions WHERE check_type = ? AND model_hash != ?",
+                                   (check_type, model_hash)).rowcount
+        with self._lock:
+            self._purged_models.add((check_type, model_hash))
+        if deleted:
+            logger.info(f"模型已更新，清理预测结果缓存{deleted}条，check_type: {check_type}")
+
+    def _evict(self) -> None:
+        """
+        磁盘缓存超出容量时淘汰最久未访问的条目
+        :return:
+        """
+        with self._connection() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+            if count > self.max_rows:
+                conn.execute("DELETE FROM predictions WHERE rowid IN "
+                             "(SELECT rowid FROM predictions ORDER BY last_access LIMIT ?)", (count - self.max_rows,))
+
+    def get_many(self, check_type: str, model_hash: str, text_hashes: list[str]) -> dict[str, int]:
+        """
+        批量查询缓存
+        :param check_type: 检查类型
+        :param model_hash: 模型文件哈希
+        :param text_hashes: 段落文本哈希
+        :return: 命中的 {文本哈希: 标签}
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for text_hash in text_hashes:
+                key = (text_hash, check_type, model_hash)
+                label = self._memory.get(key)
+                if label is not None:
+                    self._memory.move_to_end(key)
+                    found[text_hash] = label
+                else:
+                    missing.append(text_hash)
+
+        if missing:
+            self._purge_old_models(check_type, model_hash)
+            conn = self._connection()
+            now = time.time()
+            # SQLite的参数数量有上限，分批查询
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(f"SELECT text_hash, label FROM predictions WHERE check_type = ? AND model_hash = ? "
+                                    f"AND text_hash IN ({placeholders})", (check_type, model_hash, *chunk)).fetchall()
+                if rows:
+                    with conn:
+                        conn.executemany("UPDATE predictions SET last_access = ? WHERE text_hash = ? AND check_type = ? "
+                                         "AND model_hash = ?", [(now, row[0], check_type, model_hash) for row in rows])
+                for text_hash, label in rows:
+                    found[text_hash] = label
+            self._put_memory(check_type, model_hash, {text_hash: found[text_hash] for text_hash in missing
+                                                      if text_hash in found})
+
+        with self._lock:
+            self.hits += len(text_hashes) - len(missing)
+            self.disk_hits += sum(1 for text_hash in missing if text_hash in found)
+            self.misses += sum(1 for text_hash in missing if text_hash not in found)
+        return found
+
+    def _put_memory(self, check_type: str, model_hash: str, labels: dict[str, int]) -> None:
+        with self._lock:
+            for text_hash, label in labels.items():
+                self._memory[(text_hash, check_type, model_hash)] = label
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def put_many(self, check_type: str, model_hash: str, labels: dict[str, int]) -> None:
+        """
+        批量写入缓存
+        :param check_type: 检查类型
+        :param model_hash: 模型文件哈希
+        :param labels: {文本哈希: 标签}
+        :return:
+        """
+        if not labels:
+            return
+        self._put_memory(check_type, model_hash, labels)
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO predictions (text_hash, check_type, model_hash, label, last_access) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             [(text_hash, check_type, model_hash, int(label), now) for text_hash, label in labels.items()])
+        # 计数在锁内更新，并发写入时只有一个线程执行淘汰
+        with self._lock:
+            self._writes_since_check += len(labels)
+            should_evict = self._writes_since_check >= self.EVICT_CHECK_INTERVAL
+            if should_evict:
+                self._writes_since_check = 0
+        if should_evict:
+            self._evict()
+
+    def classify(self, check_type: str, model_hash: str, texts: list[str],
+                 predict_func: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """
+        预测一批段落：先查缓存，只对未命中的段落调用模型，并把结果写入缓存
+        :param check_type: 检查类型
+        :param model_hash: 模型文件哈希
+        :param texts: 段落文本
+        :param predict_func: 模型预测方法
+        :return: 与texts一一对应的预测结果
+        """
+        text_hashes = [self.hash_text(text) for text in texts]
+        try:
+            cached = self.get_many(check_type, model_hash, text_hashes)
+        except sqlite3.Error as e:
+            logger.error(f"读取预测结果缓存失败：{str(e)}")
+            return predict_func(texts)
+
+        labels = np.zeros(len(texts), dtype=int)
+        missing: dict[str, list[int]] = {}  # 未命中的文本哈希 -> 段落下标（相同的段落只预测一次）
+        for index, text_hash in enumerate(text_hashes):
+            label = cached.get(text_hash)
+            if label is None:
+                missing.setdefault(text_hash, []).append(index)
+            else:
+                labels[index] = label
+
+        if missing:
+            predicted = predict_func([texts[indices[0]] for indices in missing.values()])
+            for indices, label in zip(missing.values(), predicted):
+                labels[indices] = label
+            try:
+                self.put_many(check_type, model_hash, {text_hash: int(label)
+                                                       for text_hash, label in zip(missing, predicted)})
+            except sqlite3.Error as e:
+                logger.error(f"写入预测结果缓存失败：{str(e)}")
+        return labels
+
+    def stats(self) -> dict:
+        """
+        缓存统计信息
+        :return:
+        """
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
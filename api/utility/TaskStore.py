@@ -0,0 +1,293 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Dict, Any, List
+from loguru import logger
+from api.app_const import TASK_STORE_PATH, TASK_RESULT_DIR, TASK_HEARTBEAT_INTERVAL, TASK_OWNER_TIMEOUT, \
+    TASK_RESULT_TTL
+
+# 任务状态
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_SUCCEEDED = "succeeded"
+STATE_FAILED = "failed"
+
+# 任务结果文件旁记录各段落文本预测结果的文件的扩展名（用于增量检查）
+LABELS_SUFFIX = ".labels.npz"
+
+
+class TaskStore:
+    """
+    异步任务的持久化记录（本地SQLite，同一节点的所有worker共享）：记录每个任务的状态、各阶段时间与结果文件位置，
+    供客户端轮询查询；每个进程定期写入心跳，心跳超时的进程（已退出或重启）未完成的任务由其他进程接管并重新执行
+    """
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path: str = TASK_STORE_PATH, result_dir: str = TASK_RESULT_DIR):
+        self.db_path = db_path
+        self.result_dir = result_dir
+        self.owner = uuid.uuid4().hex  # 当前进程的标识（进程重启后pid可能相同，因此不使用pid）
+        self._local = threading.local()
+        self._resume_handler: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        os.makedirs(result_dir, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                         "client_id TEXT NOT NULL, task_id TEXT NOT NULL, service_id INTEGER NOT NULL, "
+                         "request TEXT NOT NULL, state TEXT NOT NULL, owner TEXT NOT NULL, "
+                         "attempts INTEGER NOT NULL DEFAULT 0, message TEXT, result_path TEXT, "
+                         "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                         "PRIMARY KEY (client_id, task_id))")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks (state, owner)")
+            conn.execute("CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+        self._heartbeat()
+        atexit.register(self._release)
+
+    @classmethod
+    def get_instance(cls) -> 'TaskStore':
+        """
+        获取进程内共享的任务记录（gunicorn fork之后在各worker中重新创建，各worker有独立的标识与心跳）
+        :return:
+        """
+        pid = os.getpid()
+        if cls._instance is None or cls._instance_pid != pid:
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != pid:
+                    cls._instance = cls()
+                    cls._instance_pid = pid
+        return cls._instance
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        每个线程使用独立的SQLite连接
+        :return:
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, client_id: str, task_id: str, service_id: int, request: Dict[str, Any]) -> bool:
+        """
+        记录新任务（相同客户端重复提交已完成的task_id时覆盖原记录，重新执行）
+        :param client_id: 客户端ID
+        :param task_id: 任务ID
+        :param service_id: 服务ID
+        :param request: 执行任务所需的参数
+        :return: 是否已记录；相同task_id的任务尚未完成时不记录，返回False
+        """
+        return not self.create_many(client_id, service_id, {task_id: request})
+
+    def create_many(self, client_id: str, service_id: int, requests: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        在一个事务中记录多个新任务：任一task_id的任务尚未完成（排队或执行中）时全部不记录，
+        避免覆盖后原任务与新任务同时执行、先后写入结果
+        :param client_id: 客户端ID
+        :param service_id: 服务ID
+        :param requests: {任务ID: 执行任务所需的参数}
+        :return: 尚未完成的task_id，为空时已全部记录
+        """
+        task_ids = list(requests)
+        conn = self._connection()
+        with conn:
+            # 立即获取写锁，检查与写入之间不会有其他进程提交相同的task_id
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(f"SELECT task_id, state, result_path FROM tasks WHERE client_id = ? "
+                                f"AND task_id IN ({', '.join('?' * len(task_ids))})",
+                                (client_id, *task_ids)).fetchall()
+            unfinished = [row["task_id"] for row in rows if row["state"] in (STATE_QUEUED, STATE_RUNNING)]
+            if unfinished:
+                return unfinished
+            created_at = time.time()
+            conn.executemany("INSERT OR REPLACE INTO tasks (client_id, task_id, service_id, request, state, owner, "
+                             "attempts, created_at) VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                             [(client_id, task_id, service_id, json.dumps(request, ensure_ascii=False), STATE_QUEUED,
+                               self.owner, created_at) for task_id, request in requests.items()])
+        for row in rows:
+            if row["result_path"]:
+                self._remove_result(row["result_path"])
+        return []
+
+    def mark_running(self, client_id: str, task_id: str) -> None:
+        with self._connection() as conn:
+            conn.execute("UPDATE tasks SET state = ?, started_at = ?, attempts = attempts + 1 "
+                         "WHERE client_id = ? AND task_id = ?",
+                         (STATE_RUNNING, time.time(), client_id, task_id))
+
+    def mark_finished(self, client_id: str, task_id: str, success: bool, message: Optional[str] = None,
+                      result: Optional[bytes] = None, labels: Optional[bytes] = None) -> None:
+        """
+        记录任务完成，结果写入文件（不放在数据库中，避免大结果影响数据库）
+        :param client_id:
+        :param task_id:
+        :param success: 是否成功
+        :param message: 失败原因
+        :param result: 已编码的JSON结果
+        :param labels: 已编码的各段落文本的预测结果（TextLabels.dump_many），写入结果文件旁，与结果文件一起删除
+        :return:
+        """
+        result_path = None
+        if result is not None:
+            result_path = os.path.join(self.result_dir, f"{uuid.uuid4().hex}.json")
+            try:
+                with open(result_path, "wb") as f:
+                    f.write(result)
+                if labels is not None:
+                    with open(result_path + LABELS_SUFFIX, "wb") as f:
+                        f.write(labels)
+            except OSError as e:
+                logger.error(f"任务结果写入文件失败，task_id: {task_id}，详细信息：{str(e)}")
+                self._remove_result(result_path)
+                result_path = None
+        with self._connection() as conn:
+            conn.execute("UPDATE tasks SET state = ?, message = ?, result_path = ?, finished_at = ? "
+                         "WHERE client_id = ? AND task_id = ?",
+                         (STATE_SUCCEEDED if success else STATE_FAILED, message, result_path, time.time(),
+                          client_id, task_id))
+
+    def get(self, client_id: str, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询任务
+        :param client_id:
+        :param task_id:
+        :return: 任务记录，不存在时返回None
+        """
+        row = self._connection().execute("SELECT * FROM tasks WHERE client_id = ? AND task_id = ?",
+                                         (client_id, task_id)).fetchone()
+        return dict(row) if row is not None else None
+
+    @staticmethod
+    def read_result(task: Dict[str, Any]) -> Optional[bytes]:
+        """
+        读取任务结果
+        :param task: 任务记录
+        :return: 已编码的JSON结果，没有结果时返回None
+        """
+        if not task.get("result_path"):
+            return None
+        try:
+            with open(task["result_path"], "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def read_labels(task: Dict[str, Any]) -> Optional[bytes]:
+        """
+        读取任务记录的各段落文本的预测结果
+        :param task: 任务记录
+        :return: 已编码的预测结果，没有记录时返回None
+        """
+        if not task.get("result_path"):
+            return None
+        try:
+            with open(task["result_path"] + LABELS_SUFFIX, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def count_by_state(self) -> Dict[str, int]:
+        """
+        各状态的任务数
+        :return:
+        """
+        rows = self._connection().execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def start(self, resume_handler: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        启动心跳线程：定期写入心跳、接管心跳超时进程的未完成任务并交给resume_handler重新执行、清理过期的结果
+        :param resume_handler: 重新执行任务的方法，参数为任务记录
+        :return:
+        """
+        self._resume_handler = resume_handler
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._run, name="task-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._heartbeat()
+                self._resume_orphans()
+                self._purge_expired()
+            except Exception as e:
+                logger.exception(e)
+            time.sleep(TASK_HEARTBEAT_INTERVAL)
+
+    def _heartbeat(self) -> None:
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO owners (owner, heartbeat_at) VALUES (?, ?)",
+                         (self.owner, time.time()))
+
+    def _release(self) -> None:
+        """
+        进程正常退出时删除心跳，未完成的任务（如有）无需等待心跳超时即可由其他进程接管
+        :return:
+        """
+        try:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+        except sqlite3.Error:
+            pass
+
+    def _resume_orphans(self) -> None:
+        """
+        接管心跳超时的进程的未完成任务（通过带条件的UPDATE认领，多个进程同时接管时只有一个进程成功）
+        :return:
+        """
+        expired_before = time.time() - TASK_OWNER_TIMEOUT
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM owners WHERE heartbeat_at < ?", (expired_before,))
+        orphans: List[sqlite3.Row] = conn.execute(
+            "SELECT * FROM tasks WHERE state IN (?, ?) AND owner NOT IN (SELECT owner FROM owners)",
+            (STATE_QUEUED, STATE_RUNNING)).fetchall()
+        for orphan in orphans:
+            with conn:
+                claimed = conn.execute("UPDATE tasks SET owner = ?, state = ? "
+                                       "WHERE client_id = ? AND task_id = ? AND owner = ?",
+                                       (self.owner, STATE_QUEUED, orphan["client_id"], orphan["task_id"],
+                                        orphan["owner"])).rowcount
+            if claimed:
+                logger.info(f"接管未完成的任务，task_id: {orphan['task_id']}，已执行次数：{orphan['attempts']}")
+                self._resume_handler(dict(orphan))
+
+    def _purge_expired(self) -> None:
+        """
+        删除已完成并超过保留时间的任务及其结果文件
+        :return:
+        """
+        expired_before = time.time() - TASK_RESULT_TTL
+        conn = self._connection()
+        rows = conn.execute("SELECT client_id, task_id, result_path FROM tasks "
+                            "WHERE state IN (?, ?) AND finished_at < ?",
+                            (STATE_SUCCEEDED, STATE_FAILED, expired_before)).fetchall()
+        for row in rows:
+            if row["result_path"]:
+                self._remove_result(row["result_path"])
+            with conn:
+                conn.execute("DELETE FROM tasks WHERE client_id = ? AND task_id = ?",
+                             (row["client_id"], row["task_id"]))
+
+    @staticmethod
+    def _remove_result(result_path: str) -> None:
+        for path in (result_path, result_path + LABELS_SUFFIX):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,109 @@
+import re
+import threading
+from typing import Callable, Optional
+import numpy as np
+from api.app_const import TECH_STANDARD_PREFILTER_RULES, TECH_STANDARD_PREFILTER_LONG_TEXT
+from api.utility.TextUtils import TextUtils
+
+
+class TechStandardPreFilter:
+    """
+    技术标准识别的规则预筛选：明显不是技术标准的段落直接判为0，明显是技术标准的段落直接判为1，
+    不需要分词与模型预测；规则无法判断的段落再交给模型
+    """
+
+    # 无法判断
+    UNDECIDED = -1
+
+    # 标准编号，如 GB50300-2013、JGJ 59-2011、GB/T 50326
+    _STANDARD_CODE_PATTERN = re.compile(r'[A-Z]{2,5}\s*(/\s*[A-Z])?\s*\d{2,}(\.\d+)?\s*[-－—]\s*\d{2,4}')
+    _KEYWORD_PATTERN = re.compile(TextUtils.TECH_STANDARD_KEYWORDS)
+    _CODE_KEYWORD_PATTERN = re.compile(TextUtils.TECH_STANDARD_CODE_KEYWORDS)
+    # 编号、年份或文号（如 12056-1:2001、国发〔2015〕17号）
+    _NUMBER_PATTERN = re.compile(r'\d{2,}|〔')
+    # 《名称》后面紧跟标准编号
+    _TITLE_WITH_CODE_PATTERN = re.compile(
+        r'^《[^《》]{2,60}》\s*[\(（]?\s*[A-Z]{2,5}\s*(/\s*[A-Z])?\s*\d{2,}(\.\d+)?\s*[-－—]\s*\d{2,4}\s*[\)）]?$')
+    # 标准编号后面紧跟《名称》
+    _CODE_WITH_TITLE_PATTERN = re.compile(
+        r'^[A-Z]{2,5}\s*(/\s*[A-Z])?\s*\d{2,}(\.\d+)?\s*[-－—]\s*\d{2,4}\s*《[^《》]{2,60}》$')
+
+    def __init__(self, rule_names: list[str] = None, long_text_length: int = TECH_STANDARD_PREFILTER_LONG_TEXT):
+        """
+        :param rule_names: 启用的规则名称，为None时使用配置的规则
+        :param long_text_length: 判定为长段落的字数
+        """
+        self.long_text_length = long_text_length
+        all_rules = self.all_rules()
+        names = TECH_STANDARD_PREFILTER_RULES if rule_names is None else rule_names
+        self.rules: list[tuple[str, int, Callable[[str], bool]]] = [(name, *all_rules[name]) for name in names
+                                                                    if name in all_rules]
+        self.hit_counts: dict[str, int] = {name: 0 for name, _, _ in self.rules}
+        self._lock = threading.Lock()
+
+    def all_rules(self) -> dict[str, tuple[int, Callable[[str], bool]]]:
+        """
+        所有可用的规则：{规则名称: (命中后的标签, 判断方法)}
+        :return:
+        """
+        return {
+            # 长段落，且没有书名号、标准编号与关键词
+            "long_narrative": (0, self.is_long_narrative),
+            # 没有书名号与编号，且不包含任何关键词与标准代号
+            "no_keyword": (0, self.has_no_keyword),
+            # 《名称》+ 标准编号，或 标准编号 +《名称》
+            "title_with_code": (1, self.is_title_with_code),
+            # 符合技术标准的格式（TextUtils中的技术标准模式）
+            "standard_pattern": (1, TextUtils.fit_tech_standard_pattern),
+        }
+
+    def is_long_narrative(self, text: str) -> bool:
+        return (len(text) >= self.long_text_length and "《" not in text
+                and not self._STANDARD_CODE_PATTERN.search(text) and not self._KEYWORD_PATTERN.search(text))
+
+    def has_no_keyword(self, text: str) -> bool:
+        return ("《" not in text and not self._KEYWORD_PATTERN.search(text)
+                and not self._CODE_KEYWORD_PATTERN.search(text) and not self._NUMBER_PATTERN.search(text))
+
+    def is_title_with_code(self, text: str) -> bool:
+        text = TextUtils.normalize_tech_standard_text(text)
+        return bool(self._TITLE_WITH_CODE_PATTERN.match(text) or self._CODE_WITH_TITLE_PATTERN.match(text))
+
+    def match(self, text: str) -> Optional[tuple[str, int]]:
+        """
+        按顺序匹配规则
+        :param text: 段落文本（已去掉前后空白字符）
+        :return: 命中的（规则名称, 标签），都不命中时返回None
+        """
+        for name, label, rule in self.rules:
+            if rule(text):
+                return name, label
+        return None
+
+    def apply(self, texts: list[str]) -> np.ndarray:
+        """
+        对一批段落应用规则
+        :param texts: 段落文本（已去掉前后空白字符）
+        :return: 与texts一一对应的标签，规则无法判断的为UNDECIDED
+        """
+        labels = np.full(len(texts), self.UNDECIDED, dtype=int)
+        if not self.rules:
+            return labels
+        hits: dict[str, int] = {}
+        for index, text in enumerate(texts):
+            matched = self.match(text)
+            if matched is not None:
+                name, labels[index] = matched
+                hits[name] = hits.get(name, 0) + 1
+        with self._lock:
+            for name, count in hits.items():
+                self.hit_counts[name] += count
+        return labels
+
+    def stats(self) -> dict[str, int]:
+        """
+        每条规则的命中次数
+        :return:
+        """
+        with self._lock:
+            return dict(self.hit_counts)
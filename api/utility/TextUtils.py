@@ -1,5 +1,6 @@
-import jieba
 import re
+import numpy as np
+from api.utility.TokenCache import TokenCache
 
 
 class TextUtils:
@@ -16,49 +17,82 @@ class TextUtils:
     @staticmethod
     def chinese_tokenizer(text):
         """
-        使用 jieba 分词
+        使用 jieba 分词（经进程内分词缓存，相同段落只分词一次）
         :param text:
         :return: 对文本分词的结果
         """
-        return jieba.lcut(text)
+        return TokenCache.get_instance().tokenize(text)
+
+    # 去掉编号的正则（预编译）
+    _NUMBERING_PATTERNS = [
+        re.compile(r'^\(\d{1,2}\)\s*'),
+        re.compile(r'^（\d{1,2}）\s*'),
+        re.compile(r'^\d{1,2}\.\{1,2}}\s*'),
+        re.compile(r'^\d{1,2}\.\{1,2}}.\{1,2}}\s*'),
+        re.compile(r'^\d{1,2}\.\s*'),
+        re.compile(r'^\d{1,2}、\s*'),
+    ]
+
+    # 自定义特征的正则（预编译，与训练模型时使用的模式保持一致）
+    # 原特征为 f'(?=.*[\u4e00-\u9fff]{4, 20})(?=.*[A-Z]{2, 10})'，f-string会把{4, 20}格式化为"(4, 20)"，
+    # 模型基于该模式训练，这里保持原样；两个 .* 前瞻等价于“同一行中同时包含两者”，改为逐行分别查找，避免长段落的回溯
+    _CHINESE_WITH_CODE_PATTERNS = (re.compile('[\u4e00-\u9fff](4, 20)'), re.compile('[A-Z](2, 10)'))
+    _TECH_STANDARD_FEATURE_PATTERNS = [
+        re.compile(f'({TECH_STANDARD_CODE_KEYWORDS})'),
+        re.compile(f'({TECH_STANDARD_KEYWORDS})'),
+        re.compile(f'({TECH_STANDARD_BUSINESS_KEYWORDS})'),
+        re.compile(r'[《》\-/（）]'),  # 包含特定字符
+        re.compile(r'^(《|[A-Z]{2})'),  # 以《或字母开头
+        re.compile(r'[》）)]$'),  # 以右括号结尾
+        re.compile(r'（[A-Z]*[A-Z]{2,}[0-9]*[0-9]{4,}[A-Z0-9]*）'),
+        re.compile(TECH_STANDARD_PATTERN1),
+        re.compile(TECH_STANDARD_PATTERN2),
+        re.compile(r'^《[\u4e00-\u9fff]{4,20}》$'),
+        re.compile(r'[\d{4}]|(\d{4}年)'),
+    ]
+    TECH_STANDARD_FEATURE_COUNT = len(_TECH_STANDARD_FEATURE_PATTERNS) + 2
 
     @staticmethod
-    # 自定义特征提取函数
-    def extract_tech_standard_features(text: str) -> [int]:
-        # 清理前后的无效字符（标点符号）
+    def normalize_tech_standard_text(text: str) -> str:
+        """
+        提取技术标准特征前的文本规范化：清理前后的无效字符（标点符号）并去掉编号
+        :param text:
+        :return:
+        """
         text = text.strip().strip("。，、.-,")
+        for pattern in TextUtils._NUMBERING_PATTERNS:
+            text = pattern.sub('', text)
+        return text
+
+    @staticmethod
+    def _tech_standard_feature_row(text: str) -> [int]:
+        """
+        对规范化后的文本提取自定义特征
+        :param text: 规范化后的文本
+        :return:
+        """
+        chinese_pattern, code_pattern = TextUtils._CHINESE_WITH_CODE_PATTERNS
+        features = [int(any(chinese_pattern.search(line) and code_pattern.search(line)
+                            for line in text.split('\n')))]
+        features.extend(int(bool(pattern.search(text))) for pattern in TextUtils._TECH_STANDARD_FEATURE_PATTERNS)
+        features.append(len(text))
+        return features
 
-        # 去掉编号
-        pattern = r'^\(\d{1,2}\)\s*'
-        text = re.sub(pattern, '', text)
-        pattern = r'^（\d{1,2}）\s*'
-        text = re.sub(pattern, '', text)
-        pattern = r'^\d{1,2}\.\{1,2}}\s*'
-        text = re.sub(pattern, '', text)
-        pattern = r'^\d{1,2}\.\{1,2}}.\{1,2}}\s*'
-        text = re.sub(pattern, '', text)
-        pattern = r'^\d{1,2}\.\s*'
-        text = re.sub(pattern, '', text)
-        pattern = r'^\d{1,2}、\s*'
-        text = re.sub(pattern, '', text)
+    @staticmethod
+    # 自定义特征提取函数
+    def extract_tech_standard_features(text: str) -> [int]:
+        return TextUtils._tech_standard_feature_row(TextUtils.normalize_tech_standard_text(text))
 
-        features = [
-            int(bool(re.search(f'(?=.*[\u4e00-\u9fff]{4, 20})(?=.*[A-Z]{2, 10})', text))),
-            int(bool(re.search(f'({TextUtils.TECH_STANDARD_CODE_KEYWORDS})', text))),
-            int(bool(re.search(f'({TextUtils.TECH_STANDARD_KEYWORDS})', text))),
-            int(bool(re.search(f'({TextUtils.TECH_STANDARD_BUSINESS_KEYWORDS})', text))),
-            int(bool(re.search(r'[《》\-/（）]', text))),  # 包含特定字符
-            int(bool(re.match(r'^(《|[A-Z]{2})', text))),  # 以《或字母开头
-            int(bool(re.search(r'[》）)]$', text))),  # 以右括号结尾
-            # int(bool(re.search(r'[。，：；]', text))),  # 不包含一些符号
-            int(bool(re.search(r'（[A-Z]*[A-Z]{2,}[0-9]*[0-9]{4,}[A-Z0-9]*）', text))),
-            int(bool(re.search(TextUtils.TECH_STANDARD_PATTERN1, text))),
-            int(bool(re.search(TextUtils.TECH_STANDARD_PATTERN2, text))),
-            int(bool(re.search(r'^《[\u4e00-\u9fff]{4,20}》$', text))),
-            int(bool(re.search(r'[\d{4}]|(\d{4}年)', text))),
-            # int(bool(re.search(r'\([^\u4e00-\u9fa5]*\)', text))),
-            len(text),
-        ]
+    @staticmethod
+    def extract_tech_standard_features_batch(texts: [str]) -> np.ndarray:
+        """
+        批量提取自定义特征（训练与预测共用，保证特征一致）
+        :param texts: 段落文本
+        :return: int32的特征矩阵，形状为 (段落数, 特征数)
+        """
+        features = np.zeros((len(texts), TextUtils.TECH_STANDARD_FEATURE_COUNT), dtype=np.int32)
+        for index, text in enumerate(texts):
+            features[index] = TextUtils._tech_standard_feature_row(TextUtils.normalize_tech_standard_text(text))
         return features
 
     @staticmethod
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from api.app_const import TOKEN_CACHE_MAX_BYTES, JIEBA_CACHE_FILE
+
+
+class TokenCache:
+    """
+    jieba分词结果缓存（进程内共享，LRU方式按占用内存淘汰，线程安全）
+    同一段落在目录识别、技术标准识别以及不同请求之间只分词一次
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_bytes: int = TOKEN_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'TokenCache':
+        """
+        获取进程内共享的缓存实例
+        :return:
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def initialize_dictionary() -> None:
+        """
+        初始化jieba词典：使用固定位置的词典缓存文件（镜像构建时生成），避免在首个请求中构建前缀词典
+        （jieba在此处才导入，导入应用时不加载）
+        :return:
+        """
+        import jieba
+        cache_file = os.path.abspath(JIEBA_CACHE_FILE)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        jieba.dt.cache_file = cache_file
+        jieba.initialize()
+
+    @staticmethod
+    def _size_of(text: str, tokens: tuple) -> int:
+        """
+        估算一条缓存占用的内存
+        :param text:
+        :param tokens:
+        :return:
+        """
+        return sys.getsizeof(text) + sys.getsizeof(tokens) + sum(sys.getsizeof(token) for token in tokens)
+
+    def tokenize(self, text: str) -> list[str]:
+        """
+        分词（优先从缓存中获取）
+        :param text: 经vectorizer规范化（转小写）后的段落文本
+        :return: 分词结果
+        """
+        with self._lock:
+            tokens = self._items.get(text)
+            if tokens is not None:
+                self._items.move_to_end(text)
+                self.hits += 1
+                return list(tokens)
+            self.misses += 1
+
+        # 分词不持有锁，避免阻塞其他线程
+        import jieba
+        if not jieba.dt.initialized:
+            TokenCache.initialize_dictionary()
+        tokens = tuple(jieba.lcut(text))
+        size = self._size_of(text, tokens)
+        if size > self.max_bytes:
+            return list(tokens)
+
+        with self._lock:
+            if text not in self._items:
+                self._items[text] = tokens
+                self.current_bytes += size
+                # 超出容量时淘汰最久未使用的条目
+                while self.current_bytes > self.max_bytes:
+                    old_text, old_tokens = self._items.popitem(last=False)
+                    self.current_bytes -= self._size_of(old_text, old_tokens)
+        return list(tokens)
+
+    def stats(self) -> dict:
+        """
+        缓存统计信息
+        :return:
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
+
+    def clear(self) -> None:
+        """
+        清空缓存
+        :return:
+        """
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
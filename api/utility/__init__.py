@@ -1,3 +1,16 @@
 from .UieHelper import UieHelper
+from .TokenCache import TokenCache
+from .Metrics import Metrics
 from .HttpUtils import HttpUtils
 from .TextUtils import TextUtils
+from .FeatureUtils import FeatureUtils
+from .PredictionCache import PredictionCache
+from .CascadeClassifier import CascadeClassifier
+from .TechStandardPreFilter import TechStandardPreFilter
+from .MemoryUtils import MemoryUtils
+from .ModelArtifact import ModelArtifact
+from .JsonStreamReader import JsonStreamReader
+from .JsonUtils import JsonUtils, RawJson
+from .TaskStore import TaskStore, STATE_QUEUED, STATE_RUNNING, STATE_SUCCEEDED, STATE_FAILED
+from .BoundedExecutor import BoundedExecutor, REJECT_QUEUE_FULL, REJECT_CLIENT_LIMIT
+from .DownloadCache import DownloadCache
@@ -0,0 +1,19 @@
+# Gunicorn 配置
+# preload_app：在master进程中加载应用（含模型），fork出的worker进程通过写时复制共享模型内存
+from loguru import logger
+from api.utility import MemoryUtils
+from api.app_const import GUNICORN_WORKERS
+
+bind = "0.0.0.0:5000"
+# worker进程数（环境变量WEB_CONCURRENCY，默认4；进程池推理后端的默认进程数按此平分CPU核数）
+workers = GUNICORN_WORKERS
+preload_app = True
+
+
+def post_fork(server, worker):
+    """
+    worker进程创建后启动回调发送器与任务记录的心跳（继续发送未发送成功的回调、接管已退出进程未完成的任务），并记录内存占用
+    """
+    from api.app import start_background_services
+    start_background_services()
+    logger.info(f"worker已启动，内存占用(MB)：{MemoryUtils.get_memory_usage()}")
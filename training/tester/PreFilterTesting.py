@@ -0,0 +1,37 @@
+from training.trainer.TechStandardTraining import TechStandardTraining
+from api.utility import TechStandardPreFilter
+
+
+class PreFilterTesting:
+    """
+    技术标准规则预筛选的离线评估
+    """
+
+    def measure_rule_precision(self, file_path: str = "./data/tech_standard_data.xlsx") -> dict:
+        """
+        分别统计每条规则在标注数据上的命中数与精确率（规则各自独立评估，不受顺序影响）
+        :param file_path: 标注数据文件
+        :return: {规则名称: {"hits": 命中数, "correct": 命中且正确的数量, "precision": 精确率, "coverage": 命中比例}}
+        """
+        training_data = TechStandardTraining().load_training_data(file_path)
+        texts = [str(row["content"][0]).strip() for row in training_data]
+        labels = [int(row["label"]) for row in training_data]
+
+        prefilter = TechStandardPreFilter(rule_names=[])
+        report = {}
+        for name, (rule_label, rule) in prefilter.all_rules().items():
+            hits = 0
+            correct = 0
+            for text, label in zip(texts, labels):
+                if rule(text):
+                    hits += 1
+                    correct += int(label == rule_label)
+            report[name] = {
+                "hits": hits,
+                "correct": correct,
+                "precision": correct / hits if hits else 0.0,
+                "coverage": hits / len(texts) if texts else 0.0
+            }
+            print(f"规则 {name}（判为{rule_label}）：命中 {hits}，正确 {correct}，"
+                  f"精确率 {report[name]['precision']:.4f}，覆盖率 {report[name]['coverage']:.2%}")
+        return report
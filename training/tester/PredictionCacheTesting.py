@@ -0,0 +1,37 @@
+import os
+import tempfile
+import numpy as np
+from training.trainer.TechStandardTraining import TechStandardTraining
+from api.services.TechStandardIdentifyService import TechStandardIdentifyService
+from api.utility import PredictionCache
+from api.app_const import InvalidContentType
+
+
+class PredictionCacheTesting:
+    """
+    预测结果缓存的一致性检查：经缓存预测的结果必须与直接调用模型的结果相同
+    """
+
+    def compare_with_model(self, file_path: str = "./data/tech_standard_data.xlsx") -> int:
+        """
+        在标注数据上分别直接调用模型与经缓存预测（缓存为空时与全部命中时各一次），统计结果不同的段落数
+        :param file_path: 标注数据文件
+        :return: 结果不同的段落数（应为0）
+        """
+        training_data = TechStandardTraining().load_training_data(file_path)
+        texts = [str(row["content"][0]).strip() for row in training_data]
+
+        service = TechStandardIdentifyService()
+        expected = np.asarray(service.predict_texts(texts))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = PredictionCache(db_path=os.path.join(temp_dir, "predictions.db"))
+            mismatches = 0
+            for round_name in ("缓存为空", "全部命中"):
+                labels = cache.classify(InvalidContentType.TECH_STANDARD.value, service.model_hash, texts,
+                                        service.predict_texts)
+                different = np.flatnonzero(labels != expected)
+                mismatches += len(different)
+                print(f"{round_name}：段落数 {len(texts)}，与模型结果不同 {len(different)}")
+                for index in different[:10]:
+                    print(f"  {texts[index]!r}：缓存 {labels[index]}，模型 {expected[index]}")
+        return mismatches
@@ -0,0 +1,118 @@
+import http.server
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+
+class StartupTesting:
+    """
+    冷启动测试：从启动服务进程开始，统计 /health 可访问、/ready 就绪、首个请求成功 的耗时
+    """
+
+    SAMPLE_DOCUMENT = {
+        "group1": {
+            "doc1": {
+                "paragraphs": [
+                    {"id": "1", "page": "1", "text": "GB50300-2013《建筑工程施工质量验收统一标准》"},
+                    {"id": "2", "page": "1", "text": "《中华人民共和国建筑法》"},
+                    {"id": "3", "page": "2", "text": "认真落实施工组织设计中安全技术管理的各项措施。"}
+                ]
+            }
+        }
+    }
+
+    def __init__(self, project_dir: str = "..", port: int = 5099, timeout: float = 120):
+        """
+        :param project_dir: 项目根目录（api所在目录）
+        :param port: 服务端口
+        :param timeout: 超时时间（秒）
+        """
+        self.project_dir = os.path.abspath(project_dir)
+        self.port = port
+        self.timeout = timeout
+
+    def _serve_sample_document(self) -> tuple[http.server.HTTPServer, str]:
+        """
+        在本地启动一个HTTP服务提供样例标书文件
+        :return: HTTP服务，样例文件URL
+        """
+        directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, "sample.json"), "w", encoding="utf-8") as file:
+            json.dump(self.SAMPLE_DOCUMENT, file, ensure_ascii=False)
+
+        class QuietHandler(http.server.SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=directory, **kwargs)
+
+            def log_message(self, format, *args):
+                pass
+
+        handler = QuietHandler
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://127.0.0.1:{server.server_port}/sample.json"
+
+    def _wait_for(self, checks: dict, start_time: float) -> dict:
+        """
+        轮询各项检查，记录每一项首次通过的时间
+        :param checks: {名称: 检查方法}
+        :param start_time: 开始时间
+        :return: {名称: 从启动开始的耗时（秒）}，超时未通过的为-1
+        """
+        result = {name: -1.0 for name in checks}
+        while time.perf_counter() - start_time < self.timeout and any(value < 0 for value in result.values()):
+            for name, check in checks.items():
+                if result[name] >= 0:
+                    continue
+                try:
+                    if check():
+                        result[name] = time.perf_counter() - start_time
+                except requests.RequestException:
+                    pass
+            time.sleep(0.05)
+        return result
+
+    def time_to_first_request(self, options: list[str] = None, extra_env: dict = None) -> dict:
+        """
+        启动gunicorn并统计冷启动各阶段的耗时
+        :param options: 检查项
+        :param extra_env: 额外的环境变量（如 PRELOAD_MODELS=0）
+        :return: {"health": 秒, "ready": 秒, "first_request": 秒}
+        """
+        options = options or ["tech_standard"]
+        server, sample_url = self._serve_sample_document()
+        base_url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, **(extra_env or {}))
+
+        start_time = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", "1",
+                                    "-b", f"127.0.0.1:{self.port}", "api.app:app"],
+                                   cwd=self.project_dir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            def first_request() -> bool:
+                token = requests.post(f"{base_url}/auth/get_token", timeout=5,
+                                      json={"client_id": "yqb", "client_credential": "7Kj#mRpL9q@X"}).json()["token"]
+                response = requests.post(f"{base_url}/service?id=101&is_sync=1", timeout=60,
+                                         headers={"Authorization": f"Bearer {token}"},
+                                         json={"task_id": "startup-test", "url": sample_url, "options": options})
+                return response.ok and response.json().get("success") is True
+
+            result = self._wait_for({
+                "health": lambda: requests.get(f"{base_url}/health", timeout=1).ok,
+                "ready": lambda: requests.get(f"{base_url}/ready", timeout=1).ok,
+                "first_request": first_request
+            }, start_time)
+        finally:
+            process.terminate()
+            process.wait()
+            server.shutdown()
+
+        print(f"冷启动耗时（秒）：/health {result['health']:.2f}，/ready {result['ready']:.2f}，"
+              f"首个请求成功 {result['first_request']:.2f}")
+        return result
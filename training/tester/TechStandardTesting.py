@@ -8,7 +8,8 @@ from training.trainer.TocTraining import TocTraining
 import json
 import scipy.sparse as sp
 import time
-from api.utility import TextUtils
+from api.utility import TextUtils, FeatureUtils
+import tracemalloc
 from sklearn.feature_selection import SelectKBest, f_classif
 import numpy as np
 
@@ -62,14 +63,9 @@ class TechStandardTesting:
         for file_path in files:
             json_data = read_json_file(file_path)
             texts = [text for text in extract_texts_from_json(json_data) if text.strip()]
-            vectors = vectorizer.transform(texts)
-
-            custom_features = [TextUtils.extract_tech_standard_features(text) for text in texts]
-            vectors = sp.hstack((vectors, custom_features))
-
-            # 使用特征选择
+            # 使用特征选择（直接在稀疏矩阵上选择特征列）
             feature_indices = np.load(TechStandardTraining.FEATURE_INDEX_PATH)
-            vectors = vectors.toarray()[:, feature_indices]
+            vectors = FeatureUtils.build_tech_standard_features(vectorizer, texts, feature_indices)
 
             prediction = model.predict(vectors)
 
@@ -170,3 +166,39 @@ class TechStandardTesting:
         print(end_time)
         execution_time = end_time - start_time
         print(f"循环执行时间: {execution_time} 秒")
+
+    def memory_test(self, paragraph_count: int = 50000) -> None:
+        """
+        特征构建的内存峰值对比：稠密矩阵后再选择特征列 vs 直接在稀疏矩阵上选择特征列
+        :param paragraph_count: 模拟的段落数
+        :return:
+        """
+        vectorizer = joblib.load(TechStandardTraining.VECTORIZER_PATH)
+        feature_indices = np.load(TechStandardTraining.FEATURE_INDEX_PATH)
+
+        samples = ["GB50300-2013《建筑工程施工质量验收统一标准》",
+                   "认真落实施工组织设计中安全技术管理的各项措施，严格执行安全技术措施审批制度。",
+                   "安全管理组织保证体系及责任",
+                   "《中华人民共和国建筑法》"]
+        texts = [samples[i % len(samples)] for i in range(paragraph_count)]
+        vectors = vectorizer.transform(texts)
+        custom_features = TextUtils.extract_tech_standard_features_batch(texts)
+
+        # 原方式：整个矩阵转为稠密矩阵后再选择特征列
+        tracemalloc.start()
+        dense_vectors = sp.hstack((vectors, custom_features)).toarray()[:, feature_indices]
+        _, dense_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del dense_vectors
+
+        # 新方式：在稀疏矩阵上选择特征列
+        tracemalloc.start()
+        sparse_vectors = FeatureUtils.select_columns(sp.hstack((vectors, sp.csr_matrix(custom_features))),
+                                                     feature_indices)
+        _, sparse_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del sparse_vectors
+
+        print(f"段落数: {paragraph_count}, 特征数: {vectors.shape[1] + custom_features.shape[1]}")
+        print(f"稠密方式内存峰值: {dense_peak / 1024 / 1024:.2f} MB")
+        print(f"稀疏方式内存峰值: {sparse_peak / 1024 / 1024:.2f} MB")
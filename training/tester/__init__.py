@@ -1 +1,4 @@
 from .TechStandardTesting import TechStandardTesting
+from .PreFilterTesting import PreFilterTesting
+from .StartupTesting import StartupTesting
+from .PredictionCacheTesting import PredictionCacheTesting
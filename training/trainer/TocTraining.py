@@ -3,7 +3,7 @@ from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_sc
 import joblib
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.feature_extraction.text import TfidfVectorizer
-from api.utility import TextUtils
+from api.utility import TextUtils, ModelArtifact
 import pandas as pd
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
@@ -95,6 +95,10 @@ class TocTraining:
         # 保存vectorizer
         joblib.dump(vectorizer, TocTraining.VECTORIZER_PATH)
 
+        # 导出可内存映射的版本（服务加载时多个进程共享）
+        ModelArtifact.export(best_rf, TocTraining.MODEL_PATH)
+        ModelArtifact.export(vectorizer, TocTraining.VECTORIZER_PATH)
+
     def train_with_multi_models(self, file_name: str) -> None:
         training_data = self.load_training_data(file_name)
 
@@ -1,5 +1,5 @@
 from trainer import TechStandardTraining, TocTraining
-from tester import TechStandardTesting
+from tester import TechStandardTesting, PreFilterTesting, StartupTesting, PredictionCacheTesting
 
 
 def train_model_tech_standard() -> None:
@@ -35,12 +35,45 @@ def load_and_test_tech_standard_model() -> None:
     tech_standard_testing.load_and_test_model()
 
 
+def measure_tech_standard_prefilter() -> None:
+    """
+    评估技术标准规则预筛选中每条规则的精确率
+    :return:
+    """
+    prefilter_testing = PreFilterTesting()
+    prefilter_testing.measure_rule_precision("./data/tech_standard_data.xlsx")
+
+
+def check_prediction_cache() -> None:
+    """
+    检查经预测结果缓存的结果与直接调用模型的结果一致
+    :return:
+    """
+    prediction_cache_testing = PredictionCacheTesting()
+    prediction_cache_testing.compare_with_model("./data/tech_standard_data.xlsx")
+
+
+def measure_startup() -> None:
+    """
+    冷启动测试（首个请求成功的耗时）
+    :return:
+    """
+    startup_testing = StartupTesting(project_dir="..")
+    startup_testing.time_to_first_request()
+
+
 def main() -> None:
     # 训练技术标准模型
     train_model_tech_standard()
     # train_model_toc()
     # 测试技术标准模型
     load_and_test_tech_standard_model()
+    # 评估规则预筛选
+    # measure_tech_standard_prefilter()
+    # 检查预测结果缓存与模型结果一致
+    # check_prediction_cache()
+    # 冷启动测试
+    # measure_startup()
 
 
 if __name__ == "__main__":